@@ -0,0 +1,76 @@
+# Checks that the streaming CourseWriter writes the same bytes as the original ElementTree implementation and compares
+# their speed.
+# usage: python benchmarks/course_writer.py [course.xml ...]
+# without arguments courses/de.neo2.xml and a few edge cases (no lessons, markup, CRLF and empty texts) are checked
+
+import copy
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+repository_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, repository_directory)
+
+from ktouch_modify_neo2_course import read_lessons, write_course
+
+def dict_to_xml(name, data, keys, parent = None):
+    main_element = ET.Element(name) if parent is None else ET.SubElement(parent, name)
+    for key in keys:
+        element = ET.SubElement(main_element, key)
+        element.text = data[key]
+
+    return main_element
+
+def original_write_course(filename, course, lessons):
+    # the original implementation, with the ids given instead of random ones
+    course_element = dict_to_xml('course', course, ['id', 'title', 'description', 'keyboardLayout'])
+    lessons_element = ET.SubElement(course_element, 'lessons')
+    for lesson in lessons:
+        dict_to_xml('lesson', lesson, ['id', 'title', 'newCharacters', 'text'], lessons_element)
+    ET.indent(course_element, space=" ")
+    ET.ElementTree(course_element).write(filename, encoding='utf-8')
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def compare(name, course, lessons, directory):
+    filename = os.path.join(directory, 'new.xml')
+    original_filename = os.path.join(directory, 'original.xml')
+
+    # write_course assigns the ids, the original implementation writes the same ones
+    new_time = timed(write_course, filename, course, lessons)
+    original_time = timed(original_write_course, original_filename, course, lessons)
+
+    with open(filename, 'rb') as file, open(original_filename, 'rb') as original_file:
+        identical = file.read() == original_file.read()
+
+    print(f'{name}: {len(lessons)} lessons, original {original_time * 1000:.1f}ms, CourseWriter {new_time * 1000:.1f}ms, {"identical" if identical else "DIFFERENT"}')
+
+    return identical
+
+if __name__ == '__main__':
+    course = {'title': 'Test <&> "course"', 'description': 'Beschreibung\nmit Zeilen', 'keyboardLayout': 'de(test)'}
+    filenames = sys.argv[1:] or [os.path.join(repository_directory, 'courses', 'de.neo2.xml')]
+
+    cases = [(filename, read_lessons(filename)) for filename in filenames]
+
+    if len(sys.argv) == 1:
+        cases += [
+            ('no lessons', []),
+            ('markup', [{'title': '<b>&amp; "quotes"</b>', 'newCharacters': '<>&', 'text': 'a < b && c > d\n]]> \'single\''}]),
+            ('CRLF', [{'title': 'crlf', 'newCharacters': 'ab', 'text': 'line one\r\nline two\r\n'}]),
+            ('empty texts', [{'title': 'empty', 'newCharacters': None, 'text': None}, {'title': 'blank', 'newCharacters': '', 'text': ''}]),
+        ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [compare(name, copy.deepcopy(course), lessons, directory) for name, lessons in cases]
+
+    if not all(results):
+        sys.exit('CourseWriter output differs from the original implementation')
+
+    print('results are identical')
@@ -0,0 +1,60 @@
+# Benchmark of the n-gram counting against the original pure python implementation.
+# usage: python benchmarks/ngrams.py [<NAME>-sentences.txt ...]
+# without arguments random sentences are generated
+
+import collections
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ktouch_modify_neo2_course import count_ngrams
+
+def ngram_statistics(texts, n=2):
+    # the original implementation, counting every n-gram and filtering afterwards
+    stats = collections.defaultdict(int)
+
+    for text in texts:
+        for i in range(len(text) - n + 1):
+            ngram = text[i:i+n]
+            stats[ngram] += 1
+
+    return {ngram: count for ngram, count in stats.items() if not any(c.isspace() for c in ngram)}
+
+def random_sentences(count, seed=0):
+    rng = random.Random(seed)
+    letters = 'eeeeeennnnniiiisssrrrraaattthhdduullcggmmobwfkzpvßjyxqäöüEDSAMBWFKZ'
+    return [' '.join(''.join(rng.choices(letters, k=rng.randint(2, 12))) for _ in range(rng.randint(3, 15))) + '.' for _ in range(count)]
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        texts = list(pd.concat([pd.read_csv(filename, sep='\t', names=['text'], quoting=3, na_filter=False, dtype={'text': str}) for filename in sys.argv[1:]], ignore_index=True)['text'])
+    else:
+        texts = random_sentences(100000)
+
+    print(f'{len(texts)} sentences, {sum(map(len, texts))} characters')
+
+    old_stats = {}
+    old_time = 0
+    for n in (2, 3):
+        old_stats[n], duration = timed(ngram_statistics, texts, n)
+        old_time += duration
+        print(f'original n={n}: {duration:.3f}s')
+
+    new_stats, new_time = timed(count_ngrams, texts, (2, 3))
+    print(f'count_ngrams n=(2, 3): {new_time:.3f}s ({old_time / new_time:.1f}x faster)')
+
+    for n in (2, 3):
+        if dict(new_stats[n]) != old_stats[n]:
+            sys.exit(f'results differ for n={n}')
+
+    print('results are identical')
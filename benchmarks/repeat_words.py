@@ -0,0 +1,79 @@
+# Benchmark of the line layout of repeat_words against the original implementation.
+# usage: python benchmarks/repeat_words.py [line count ...]
+
+import itertools
+import os
+import random
+import sys
+import time
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ktouch_modify_neo2_course import repeat_words
+
+def original_repeat_words(words, repeats=10, line_length=60, line_count=30, random_post_insert=",.", random_post_insert_probability=0):
+    # the original implementation, appending one word after the other
+    lines = []
+    repeated = 0
+    current_word = 0
+    current_word_length = len(words[current_word])
+
+    while len(lines) < line_count:
+        current_line = []
+        current_line_length = 0
+
+        while current_line_length + current_word_length <= line_length:
+            if random_post_insert_probability > 0 and current_line_length + current_word_length < line_length:
+                if random.random() <= random_post_insert_probability:
+                    current_line.append(words[current_word] + random.choice(random_post_insert))
+                    current_line_length += current_word_length + 2
+                else:
+                    current_line.append(words[current_word])
+                    current_line_length += current_word_length + 1
+            else:
+                current_line.append(words[current_word])
+                current_line_length += current_word_length + 1
+            repeated += 1
+
+            if repeated == repeats:
+                current_word = (current_word + 1) % len(words)
+                current_word_length = len(words[current_word])
+                repeated = 0
+
+        lines.append(' '.join(current_line))
+
+    return '\n'.join(lines)
+
+def best_time(function, *args, repeat=5, **kwargs):
+    durations = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+
+    return result, min(durations)
+
+if __name__ == '__main__':
+    line_counts = [int(argument) for argument in sys.argv[1:]] or [30, 2000, 100000]
+
+    rng = random.Random(0)
+    words = [''.join(rng.choices('eeeeeennnnniiiisssrrrraaattthhdduullcggmmobwfkzpvßjyxqäöü', k=rng.randint(2, 10))) for _ in range(5000)]
+
+    for line_count, repeats, probability in itertools.product(line_counts, (1, 3, 10), (0, 0.3)):
+        # both draw the punctuation from the random module with the same seed
+        random.seed(0)
+        old_text, old_time = best_time(original_repeat_words, words, repeats, 60, line_count, random_post_insert_probability=probability, repeat=1)
+        random.seed(0)
+        new_text, new_time = best_time(repeat_words, words, repeats, 60, line_count, random_post_insert_probability=probability, repeat=1)
+
+        if new_text != old_text:
+            sys.exit(f'results differ for {line_count} lines, {repeats} repeats and punctuation {probability}')
+
+        _, old_time = best_time(original_repeat_words, words, repeats, 60, line_count, random_post_insert_probability=probability)
+        _, new_time = best_time(repeat_words, words, repeats, 60, line_count, random_post_insert_probability=probability)
+
+        print(f'{line_count:7d} lines, {repeats:2d} repeats, punctuation {probability}: original {old_time * 1000:9.3f}ms, repeat_words {new_time * 1000:9.3f}ms (speedup {old_time / new_time:.2f}x)')
+
+    print('results are identical')
@@ -0,0 +1,177 @@
+# Benchmark of the course generation on synthetic corpora of different sizes, see synthetic_corpus.py.
+# The results are appended to benchmarks/history.json together with the git commit, so that regressions
+# can be found by comparing the runs of different commits.
+# usage: python benchmarks/run.py [--rows 10000 100000 ...] [--layouts courses.json] [--no-courses]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.dirname(benchmark_directory)
+
+sys.path.insert(0, repository_directory)
+
+import ktouch_modify_neo2_course as ktouch
+from synthetic_corpus import generate_corpus
+
+def timed(function, *args, repeat=1, **kwargs):
+    # the best of several runs
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+
+    return result, best
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repository_directory, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repository_directory, capture_output=True, text=True, check=True).stdout.strip() != ''
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+    return commit, dirty
+
+def lesson_benchmarks(corpus_data, layout, results, errors, repeat):
+    builder = ktouch.CourseBuilder(corpus_data, layout)
+
+    # the state of the course after all groups have been introduced
+    builder.current_group = len(builder.groups) - 1
+
+    words = list(corpus_data.word_df['text'][:200])
+
+    for name, function, args, kwargs in [
+        ('repeat_words', ktouch.repeat_words, (words, 10, 60, 30), {}),
+        ('word_lesson', builder.word_lesson, (3, 30), {}),
+        ('word_lesson start_letters', builder.word_lesson, (3, 30), {'current_group_only': False, 'start_letters': True, 'min_letter_count': 3}),
+        ('word_lesson coverage', builder.word_lesson, (3, 30), {'coverage': True}),
+        ('bigram_lesson', builder.bigram_lesson, (), {}),
+        ('bigram_lesson coverage', builder.bigram_lesson, (), {'coverage': True}),
+        ('sentence_lesson', builder.sentence_lesson, (10,), {'max_length': ktouch.max_sentence_length}),
+    ]:
+        try:
+            _, results[name] = timed(function, *args, repeat=repeat, **kwargs)
+        except Exception as error:
+            errors[name] = f'{type(error).__name__}: {error}'
+
+def course_benchmarks(corpus_data, layouts, output_directory, results, errors):
+    for layout in layouts:
+        filename = os.path.basename(layout['output_filename'])
+        name = f'course {os.path.splitext(filename)[0]}'
+        layout = dict(layout, output_filename=os.path.join(output_directory, filename))
+
+        try:
+            _, results[name] = timed(ktouch.generate_course, corpus_data, layout, True)
+        except Exception as error:
+            errors[name] = f'{type(error).__name__}: {error}'
+
+def run(rows, seed, layouts, corpus_directory, repeat=3, courses=True):
+    name = generate_corpus(corpus_directory, rows, seed)
+
+    words_filename = os.path.join(corpus_directory, name, f'{name}-words.txt')
+    sentences_filename = os.path.join(corpus_directory, name, f'{name}-sentences.txt')
+
+    results = {}
+    errors = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        ktouch.corpus_directory = corpus_directory
+
+        # the stages of the corpus loading without and with the disk cache
+        ktouch.cache_directory = None
+
+        word_df, results['load_and_prepare_word_list words'] = timed(ktouch.load_and_prepare_word_list, [words_filename], True, 10)
+        sentence_df, results['load_and_prepare_word_list sentences'] = timed(ktouch.load_and_prepare_word_list, [sentences_filename], max_length=ktouch.max_sentence_length)
+        _, results['prepare_ngram_lists'] = timed(ktouch.prepare_ngram_lists, sentence_df)
+        _, results['CorpusIndex'] = timed(lambda: (ktouch.CorpusIndex(word_df), ktouch.CorpusIndex(sentence_df, with_words=False)))
+
+        layout_filenames = sorted(filename for filename in os.listdir(ktouch.layout_directory) if filename.endswith('.xml')) if os.path.isdir(ktouch.layout_directory) else []
+        if layout_filenames:
+            keyboard_layout = ktouch.KeyboardLayout(os.path.join(ktouch.layout_directory, layout_filenames[0]))
+            _, results['KeyboardLayout.scores words'] = timed(keyboard_layout.scores, word_df['text'])
+            _, results['KeyboardLayout.scores sentences'] = timed(keyboard_layout.scores, sentence_df['text'])
+
+        corpus_data, results['Corpus'] = timed(ktouch.Corpus, [name])
+
+        ktouch.cache_directory = os.path.join(directory, 'cache')
+        ktouch.Corpus([name])
+        _, results['Corpus cached'] = timed(ktouch.Corpus, [name])
+
+        # lessons and courses without the lesson cache
+        ktouch.cache_directory = None
+
+        layouts = [layout | {'seed': seed} for layout in layouts]
+        lesson_benchmarks(corpus_data, layouts[0], results, errors, repeat)
+
+        if courses:
+            course_benchmarks(corpus_data, layouts, directory, results, errors)
+
+    return {'rows': rows, 'seed': seed, 'words': len(corpus_data.word_df), 'sentences': len(corpus_data.sentence_df), 'results': results, 'errors': errors}
+
+def previous_entry(history, entry):
+    for previous in reversed(history):
+        if previous['commit'] != entry['commit'] and previous['rows'] == entry['rows'] and previous['seed'] == entry['seed']:
+            return previous
+
+    return None
+
+def report(entry, previous):
+    print(f"{entry['rows']} rows ({entry['words']} words, {entry['sentences']} sentences)")
+
+    for name, duration in entry['results'].items():
+        line = f'  {name:<50} {duration:9.4f}s'
+
+        if previous is not None and name in previous['results']:
+            line += f"  {duration / previous['results'][name]:6.2f}x of {(previous['commit'] or 'unknown')[:8]}"
+
+        print(line)
+
+    for name, error in entry['errors'].items():
+        print(f'  {name:<50} failed: {error}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the course generation on synthetic corpora.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='sizes of the synthetic corpora (number of words and sentences)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic corpora and the lessons')
+    parser.add_argument('--layouts', default=os.path.join(repository_directory, 'courses.json'), help='JSON file with the layouts to generate courses for (see --batch of the script)')
+    parser.add_argument('--corpus-directory', default=os.path.join(benchmark_directory, 'corpus'), help='folder for the synthetic corpora, they are only generated once')
+    parser.add_argument('--history', default=os.path.join(benchmark_directory, 'history.json'), help='JSON file the results are appended to')
+    parser.add_argument('--repeat', type=int, default=3, help='the lesson benchmarks report the best of this many runs')
+    parser.add_argument('--no-courses', action='store_true', help='skip the generation of the full courses')
+    arguments = parser.parse_args()
+
+    # the course files are read relative to the repository
+    os.chdir(repository_directory)
+
+    layouts = ktouch.load_layouts(arguments.layouts)
+
+    try:
+        with open(arguments.history, encoding='utf-8') as file:
+            history = json.load(file)
+    except (OSError, ValueError):
+        history = []
+
+    commit, dirty = git_commit()
+
+    for rows in arguments.rows:
+        entry = {'commit': commit, 'dirty': dirty, 'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__}
+        entry |= run(rows, arguments.seed, layouts, os.path.abspath(arguments.corpus_directory), arguments.repeat, not arguments.no_courses)
+
+        report(entry, previous_entry(history, entry))
+        history.append(entry)
+
+        with open(arguments.history, 'w', encoding='utf-8') as file:
+            json.dump(history, file, indent=1)
@@ -0,0 +1,100 @@
+# Generates a synthetic corpus in the format of the Leipzig corpora (<NAME>-words.txt and <NAME>-sentences.txt),
+# so that the script can be benchmarked at different scales without downloading a corpus.
+# usage: python benchmarks/synthetic_corpus.py [--rows 100000] [--seed 0] [--directory benchmarks/corpus]
+
+import argparse
+import os
+
+import numpy as np
+
+# the most frequent german words, the remaining vocabulary consists of random words
+common_words = 'der die und in den von zu das mit sich des auf für ist im dem nicht ein Die eine als auch es an werden aus er hat dass sie nach wird bei einer Der um am sind noch wie einem über einen Das so Sie zum war haben nur oder aber vor zur bis mehr durch man sein wurde sei In'.split(' ')
+
+# relative frequencies of the characters in german texts
+letter_frequencies = {'e': 16.4, 'n': 9.8, 'i': 7.6, 's': 7.3, 'r': 7.0, 'a': 6.5, 't': 6.2, 'd': 5.1, 'h': 4.8, 'u': 4.2, 'l': 3.4, 'g': 3.0, 'c': 2.7, 'm': 2.5, 'o': 2.5, 'b': 1.9, 'w': 1.9, 'f': 1.7, 'k': 1.2, 'z': 1.1, 'p': 0.8, 'v': 0.7, 'ü': 0.65, 'ä': 0.54, 'ß': 0.3, 'ö': 0.3, 'j': 0.3, 'y': 0.04, 'x': 0.03, 'q': 0.02}
+
+# exponent of the zipf distribution of the word frequencies
+zipf_exponent = 1.07
+
+def corpus_name(rows, seed=0):
+    return f'synthetic_{rows}_{seed}'
+
+def random_words(rng, count):
+    letters = np.array(list(letter_frequencies))
+    probabilities = np.array(list(letter_frequencies.values()))
+    probabilities /= probabilities.sum()
+
+    words = dict.fromkeys(common_words)
+
+    while len(words) < count:
+        missing = count - len(words)
+        lengths = np.clip(rng.poisson(6, missing), 2, 20)
+        characters = ''.join(rng.choice(letters, lengths.sum(), p=probabilities))
+        ends = np.cumsum(lengths)
+
+        # about a third of the words are capitalized nouns
+        capitalize = rng.random(missing) < 0.3
+
+        for start, end, upper in zip(ends - lengths, ends, capitalize):
+            word = characters[start:end]
+            words[word.capitalize() if upper else word] = None
+
+    return list(words)[:count]
+
+def zipf_counts(count, tokens):
+    weights = np.arange(1, count + 1, dtype=np.float64) ** -zipf_exponent
+    return weights / weights.sum(), np.maximum(np.rint(weights * (tokens / weights.sum())), 1).astype(np.int64)
+
+def write_lines(filename, lines, chunk_size=100000):
+    with open(filename, 'w', encoding='utf-8') as file:
+        for start in range(0, len(lines), chunk_size):
+            file.write(''.join(f'{start + i + 1}\t{line}\n' for i, line in enumerate(lines[start:start + chunk_size])))
+
+def random_sentences(rng, words, probabilities, count, chunk_size=100000):
+    sentences = []
+
+    for start in range(0, count, chunk_size):
+        size = min(chunk_size, count - start)
+
+        # many short sentences and a long tail
+        lengths = np.clip(rng.geometric(1 / 10, size) + 1, 2, 40)
+        ends = np.cumsum(lengths)
+        tokens = words[rng.choice(len(words), ends[-1], p=probabilities)]
+        commas = rng.random(ends[-1]) < 0.06
+
+        for begin, end in zip(ends - lengths, ends):
+            sentence = ' '.join(token + ',' if comma else token for token, comma in zip(tokens[begin:end - 1], commas[begin:end - 1])) + ' ' + tokens[end - 1]
+            sentences.append(sentence[0].upper() + sentence[1:] + '.')
+
+    return sentences
+
+def generate_corpus(directory, rows, seed=0):
+    # rows is the number of lines of both the words and the sentences file
+    name = corpus_name(rows, seed)
+    path = os.path.join(directory, name)
+    words_filename = os.path.join(path, f'{name}-words.txt')
+    sentences_filename = os.path.join(path, f'{name}-sentences.txt')
+
+    if os.path.exists(words_filename) and os.path.exists(sentences_filename):
+        return name
+
+    os.makedirs(path, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+
+    words = np.array(random_words(rng, rows), dtype=object)
+    probabilities, counts = zipf_counts(rows, rows * 12)
+
+    write_lines(words_filename, [f'{word}\t{count}' for word, count in zip(words, counts)])
+    write_lines(sentences_filename, random_sentences(rng, words, probabilities, rows))
+
+    return name
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a synthetic corpus with zipf distributed word frequencies and german character frequencies.')
+    parser.add_argument('--rows', type=int, default=100000, help='number of words and sentences')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--directory', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus'), help='corpus folder to write <NAME>/<NAME>-words.txt and <NAME>/<NAME>-sentences.txt to')
+    arguments = parser.parse_args()
+
+    print(f'generated {generate_corpus(arguments.directory, arguments.rows, arguments.seed)} in {arguments.directory}')
@@ -56,9 +56,12 @@ course = {
 }
 
 # source for the databases: https://wortschatz.uni-leipzig.de/de/download/German
-# download the zip files and unpack them in the folder "corpus", so that for example the file corpus/<NAME>/<NAME>-words.txt contains the words of the database <NAME> you downloaded
+# download the archives into the folder "corpus", so that for example corpus/<NAME>.tar.gz is the database <NAME> you downloaded
+# the archives are read directly, alternatively unpack them, so that the file corpus/<NAME>/<NAME>-words.txt contains the words
 
+# with several corpora the word counts are summed up and duplicate sentences removed, [<NAME>, <weight>] weights the counts of a corpus
 corpus = ['deu_wikipedia_2021_100K']#, 'eng-simple_wikipedia_2021_100K']
+corpus_directory = 'corpus'
 
 # source: https://invent.kde.org/education/ktouch/-/blob/master/data/courses/de.neo.xml
 
@@ -66,16 +69,114 @@ output_directory = 'courses'
 neo_course_filename = 'courses/de.neo2.xml' # should probably not be modified
 output_filename = f"{output_directory}/{course['keyboardLayout'].replace('(', '.').replace(')', '')}.xml"
 
+# ktouch keyboard layout files (<keyboardLayout>.xml), only needed for the typing effort options of word and bigram lessons
+layout_directory = 'layouts'
+
+# seed of the random choices of the course (sentences, punctuation), with None the lessons are random, but unchanged
+# lessons are still reused from the lesson cache, use --rebuild (or cache_directory = None) for new random choices
+seed = None
+
+# longer sentences are not used by any lesson and thus not loaded
+max_sentence_length = 60
+
+# with coverage=True word and bigram lessons cover this many of the most frequent new bigrams and trigrams of the group first
+coverage_ngrams = 40
+
+# preprocessed corpus data is stored here and reused as long as the corpus files don't change, set to None to disable
+cache_directory = 'cache'
+
 # let's go
 
 import numpy as np
-import pandas as pd
 import xml.etree.ElementTree as ET
 import uuid
 import itertools
-import bisect
 import random
+import argparse
 import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import heapq
+import html
+import inspect
+import io
+import json
+import mmap
+import os
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+# optional profiling: when enabled (--profile) every stage of the pipeline and every lesson records its wall time,
+# the peak of the memory allocated during it (tracemalloc, which is process wide, so it is only exact without threads)
+# and the number of corpus rows it scanned
+
+class Profiler:
+    def __init__(self):
+        self.records = []
+        self.local = threading.local()
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stack = self.local.__dict__.setdefault('stack', [])
+        record = {'stage': name, 'parent': stack[-1]['stage'] if stack else None, 'depth': len(stack), 'rows': 0}
+        self.records.append(record)
+
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        record['absolute_peak'] = start_memory
+        stack.append(record)
+        start = time.perf_counter()
+
+        try:
+            yield record
+        finally:
+            record['time'] = time.perf_counter() - start
+            stack.pop()
+
+            # the peak of the stage also counts for the enclosing stages, which is why it is propagated
+            record['absolute_peak'] = max(record['absolute_peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_memory'] = record['absolute_peak'] - start_memory
+            tracemalloc.reset_peak()
+
+            if stack:
+                stack[-1]['absolute_peak'] = max(stack[-1]['absolute_peak'], record['absolute_peak'])
+                stack[-1]['rows'] += record['rows']
+
+    def add_rows(self, count):
+        stack = self.local.__dict__.get('stack')
+        if stack:
+            stack[-1]['rows'] += int(count)
+
+    def report(self):
+        print(f"{'time [s]':>9} {'peak [MB]':>10} {'rows':>10}  stage", file=sys.stderr)
+        for record in self.records:
+            print(f"{record['time']:9.3f} {record['peak_memory'] / 2 ** 20:10.1f} {record['rows']:10d}  {'  ' * record['depth']}{record['stage']}", file=sys.stderr)
+
+    def write(self, filename):
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump([{key: value for key, value in record.items() if key != 'absolute_peak'} for record in self.records], file, ensure_ascii=False, indent=1)
+
+profiler = None
+
+def profile_stage(name):
+    return profiler.stage(name) if profiler is not None else contextlib.nullcontext()
+
+def profile_rows(count):
+    if profiler is not None:
+        profiler.add_rows(count)
 
 # functions for reading/writing course files
 
@@ -83,492 +184,1981 @@ def xml_to_dict(element):
     return {e.tag: e.text for e in element.findall('*')}
 
 def read_lessons(filename):
-    tree = ET.parse(filename)
-    root = tree.getroot()
-    lessons_element = root.find('lessons')
+    # lessons are converted as soon as they are parsed and then dropped from the tree
+    lessons = []
 
-    return [xml_to_dict(lesson) for lesson in lessons_element.findall('lesson')]
+    if lxml_etree is not None:
+        events = lxml_etree.iterparse(filename, tag='lesson')
+    else:
+        events = ET.iterparse(filename)
 
-def dict_to_xml(name, data, keys, parent = None):
-    main_element = ET.Element(name) if parent is None else ET.SubElement(parent, name)
+    for _, element in events:
+        if element.tag == 'lesson':
+            lessons.append(xml_to_dict(element))
+            element.clear()
 
-    for key in keys:
-        element = ET.SubElement(main_element, key)
-        element.text = data[key]
-    
-    return main_element
+    return lessons
 
-def write_course(filename, course, lessons):
-    course['id'] = f'{{{uuid.uuid4()}}}'
+# course files are written incrementally, the output is identical to ElementTree with ET.indent(space=" ")
+
+def xml_element(name, text):
+    if not text:
+        return f'<{name} />'
+
+    # the same escaping as ElementTree (and xml.sax.saxutils, which imports much more)
+    return f'<{name}>{html.escape(text, quote=False)}</{name}>'
+
+# the ids are derived from the course title and layout and the lesson positions, so that they stay the same when
+# a course is generated again and ktouch keeps the progress of its users (a fixed course id can be configured)
+
+id_namespace = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/neXyon/ktouch_modify_neo2_course')
+
+class CourseWriter:
+    def __init__(self, filename, course):
+        if 'id' not in course:
+            name = f"{course['keyboardLayout']}/{course['title']}"
+            course['id'] = f'{{{uuid.uuid5(id_namespace, name)}}}'
+
+        self.course_uuid = uuid.UUID(course['id'].strip('{}'))
 
-    course_element = dict_to_xml('course', course, ['id', 'title', 'description', 'keyboardLayout'])
-    lessons_element = ET.SubElement(course_element, 'lessons')
+        self.filename = filename
+        self.temporary_filename = f'{filename}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self.file = open(self.temporary_filename, 'w', encoding='utf-8', errors='xmlcharrefreplace')
+        self.lesson_count = 0
 
-    for lesson in lessons:
-        lesson['id'] = f'{{{uuid.uuid4()}}}'
+        self.file.write('<course>')
+        for key in ['id', 'title', 'description', 'keyboardLayout']:
+            self.file.write(f'\n {xml_element(key, course[key])}')
+
+    def write_lesson(self, lesson):
+        lesson['id'] = f'{{{uuid.uuid5(self.course_uuid, str(self.lesson_count))}}}'
         if 'newCharacters' not in lesson:
             lesson['newCharacters'] = ''
-        dict_to_xml('lesson', lesson, ['id', 'title', 'newCharacters', 'text'], lessons_element)
 
-    ET.indent(course_element, space=" ")
+        if self.lesson_count == 0:
+            self.file.write('\n <lessons>')
+        self.lesson_count += 1
+
+        self.file.write('\n  <lesson>')
+        for key in ['id', 'title', 'newCharacters', 'text']:
+            self.file.write(f'\n   {xml_element(key, lesson[key])}')
+        self.file.write('\n  </lesson>')
+
+    def close(self, keep=True):
+        if keep:
+            self.file.write('\n </lessons>' if self.lesson_count > 0 else '\n <lessons />')
+            self.file.write('\n</course>')
+
+        self.file.close()
+
+        if keep:
+            os.replace(self.temporary_filename, self.filename)
+        else:
+            os.remove(self.temporary_filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close(exception_type is None)
+
+def write_course(filename, course, lessons):
+    with CourseWriter(filename, course) as writer:
+        for lesson in lessons:
+            writer.write_lesson(lesson)
+
+# every row gets two bitmasks of its characters: lower_mask for characters appearing in lowercase (or caseless)
+# and upper_mask for characters appearing in uppercase, both use the bits of the lowercase characters.
+# The alphabet of the bits is derived from the corpus (most frequent characters first), characters that don't fit
+# into the alphabet all share the overflow bit.
+
+overflow_bit = 63
+
+def text_codepoints(texts):
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codepoints = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32)
+
+    return codepoints, lengths
+
+def character_counts(codepoints):
+    counts = np.bincount(codepoints) if len(codepoints) > 0 else np.zeros(0, dtype=np.int64)
+    characters = np.flatnonzero(counts)
+
+    return characters, counts[characters]
+
+def extend_alphabet(alphabet, codepoints):
+    lower_counts = collections.Counter()
+    for character, count in zip(*character_counts(codepoints)):
+        for lower in chr(character).lower():
+            lower_counts[lower] += int(count)
+
+    new_characters = [character for character, _ in lower_counts.most_common() if character not in alphabet]
+
+    return alphabet + ''.join(new_characters[:max(overflow_bit - len(alphabet), 0)])
+
+def character_mask(alphabet, characters, overflow=False):
+    # by default characters missing in the alphabet are left out, so that rows containing them are never covered
+    mask = 0
+    for character in characters:
+        if character in alphabet:
+            mask |= 1 << alphabet.index(character)
+        elif overflow:
+            mask |= 1 << overflow_bit
+
+    return np.uint64(mask)
+
+def filter_masks(alphabet, characters):
+    # translates a character filter like "abcABC ," into the allowed lower and upper masks
+    lower_mask = np.uint64(0)
+    upper_mask = np.uint64(0)
+
+    for character in characters:
+        if character.lower() != character:
+            upper_mask |= character_mask(alphabet, character.lower())
+        else:
+            lower_mask |= character_mask(alphabet, character)
+
+    return lower_mask, upper_mask
+
+def segment_or(values, lengths):
+    result = np.zeros(len(lengths), dtype=values.dtype)
+    non_empty = lengths > 0
+
+    if non_empty.any():
+        starts = np.cumsum(lengths) - lengths
+        result[non_empty] = np.bitwise_or.reduceat(values, starts[non_empty])
+
+    return result
+
+def text_masks(texts, alphabet):
+    return codepoint_masks(*text_codepoints(texts), alphabet)
+
+def codepoint_masks(codepoints, lengths, alphabet):
+    characters, _ = character_counts(codepoints)
+
+    size = int(characters[-1]) + 1 if len(characters) > 0 else 0
+    lower_table = np.zeros(size, dtype=np.uint64)
+    upper_table = np.zeros(size, dtype=np.uint64)
+
+    for character in characters:
+        lower = chr(character).lower()
+        if lower != chr(character):
+            upper_table[character] = character_mask(alphabet, lower, True)
+        else:
+            lower_table[character] = character_mask(alphabet, lower, True)
+
+    return segment_or(lower_table[codepoints], lengths), segment_or(upper_table[codepoints], lengths)
+
+def typeable_rows(codepoints, lengths):
+    # only letters, space, comma and period can ever be part of a layout
+    characters, _ = character_counts(codepoints)
 
-    ET.ElementTree(course_element).write(filename, encoding='utf-8')
+    untypeable = np.zeros(int(characters[-1]) + 1 if len(characters) > 0 else 0, dtype=np.uint8)
+    for character in characters:
+        untypeable[character] = not (chr(character).isalpha() or chr(character) in ' ,.')
+
+    return segment_or(untypeable[codepoints], lengths) == 0
+
+def assign_groups(masks, alphabet, group_characters):
+    # the group of a row is the first cumulative group covering all of its characters
+    groups = np.full(len(masks), len(group_characters), dtype=np.int64)
+
+    for index in reversed(range(len(group_characters))):
+        group_mask = character_mask(alphabet, group_characters[index])
+        groups[(masks & ~group_mask) == 0] = index
+
+    return groups
+
+# the tables are plain numpy columns (the texts as object arrays), pandas is only imported to read and merge the corpus
+# files, so that courses are generated from the cached tables without it
+
+class Table:
+    __slots__ = ('columns', 'attrs')
+
+    def __init__(self, columns):
+        self.columns = dict(columns)
+        self.attrs = {}
+
+    def __len__(self):
+        return len(self.columns['text'])
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __setitem__(self, column, values):
+        self.columns[column] = values
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    @staticmethod
+    def from_frame(df):
+        return Table({column: df[column].to_numpy(dtype=object if column == 'text' else None) for column in df.columns})
+
+# on disk cache of the preprocessed corpus, the layout dependent group column is always recomputed
+
+cache_version = 6
+
+def corpus_fingerprint(filenames, *parameters):
+    fingerprint = hashlib.sha1(repr((cache_version,) + parameters).encode())
+
+    for filename in filenames:
+        stat = os.stat(split_archive_path(filename)[0] or filename)
+        fingerprint.update(f'{os.path.abspath(filename)}\0{stat.st_size}\0{stat.st_mtime_ns}\0'.encode())
+
+    return fingerprint.hexdigest()
+
+def write_cached_table(fingerprint, df, alphabet):
+    if cache_directory is None:
+        return
+
+    directory = os.path.join(cache_directory, fingerprint)
+    temporary_directory = f'{directory}.{os.getpid()}.tmp'
+    os.makedirs(temporary_directory, exist_ok=True)
+
+    columns = [column for column in df.columns if column != 'text']
+
+    with open(os.path.join(temporary_directory, 'text.txt'), 'w', encoding='utf-8', newline='\n') as file:
+        file.write('\n'.join(df['text']))
+
+    for column in columns:
+        df[column].tofile(os.path.join(temporary_directory, f'{column}.bin'))
+
+    with open(os.path.join(temporary_directory, 'meta.json'), 'w', encoding='utf-8') as file:
+        json.dump({'rows': len(df), 'alphabet': alphabet, 'columns': {column: df[column].dtype.str for column in columns}}, file, ensure_ascii=False)
+
+    try:
+        os.replace(temporary_directory, directory)
+    except OSError:
+        # another process was faster
+        for name in os.listdir(temporary_directory):
+            os.remove(os.path.join(temporary_directory, name))
+        os.rmdir(temporary_directory)
+
+def read_cached_table(fingerprint):
+    if cache_directory is None:
+        return None, None
+
+    directory = os.path.join(cache_directory, fingerprint)
+
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as file:
+            meta = json.load(file)
+
+        with open(os.path.join(directory, 'text.txt'), encoding='utf-8', newline='\n') as file:
+            texts = file.read().split('\n') if meta['rows'] > 0 else []
+
+        data = {'text': np.array(texts, dtype=object)}
+        for column, dtype in meta['columns'].items():
+            data[column] = np.fromfile(os.path.join(directory, f'{column}.bin'), dtype=np.dtype(dtype))
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+    return Table(data), meta['alphabet']
+
+# corpus files can be members of the downloaded archives, they are addressed as <archive>/<member>, for example
+# corpus/<NAME>.tar.gz/<NAME>-words.txt
+
+archive_suffixes = ('.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar', '.zip')
+
+def corpus_filename(name, kind):
+    filename = f'{corpus_directory}/{name}/{name}-{kind}.txt'
+
+    if not os.path.exists(filename):
+        for suffix in archive_suffixes:
+            archive = f'{corpus_directory}/{name}{suffix}'
+            if os.path.exists(archive):
+                return f'{archive}/{name}-{kind}.txt'
+
+    return filename
+
+def split_archive_path(filename):
+    archive, member = os.path.split(filename)
+
+    if archive.endswith(archive_suffixes):
+        return archive, member
+
+    return None, filename
+
+@contextlib.contextmanager
+def open_archive_member(archive, member):
+    import tarfile
+    import zipfile
+
+    # the members of the Leipzig archives are in a folder named like the corpus
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zip_file:
+            for name in zip_file.namelist():
+                if name == member or name.endswith('/' + member):
+                    with zip_file.open(name) as file:
+                        yield file
+                    return
+    else:
+        # tar archives are streamed, so the compressed file is read only once
+        with tarfile.open(archive, 'r|*') as tar_file:
+            for info in tar_file:
+                if info.isfile() and (info.name == member or info.name.endswith('/' + member)):
+                    yield tar_file.extractfile(info)
+                    return
+
+    raise FileNotFoundError(f'{member} not found in {archive}')
 
 # prepare bigram, word and sentence database
+# the corpus files are memory mapped and parsed in chunks, only the rows passing the filters are kept, so that
+# the memory usage depends on the useful part of the corpus (the kept texts are stored as numpy object arrays in the
+# Table, pandas is only used for parsing)
+# archive members are decompressed by a background thread while the previous chunk is parsed
+
+def mapped_chunks(filename, chunk_size):
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+
+            while start < len(data):
+                end = min(start + chunk_size, len(data))
+
+                if end < len(data):
+                    newline = data.rfind(b'\n', start, end)
+                    end = newline + 1 if newline >= 0 else data.find(b'\n', end) + 1 or len(data)
+
+                yield data[start:end]
+
+                start = end
+
+def archive_chunks(filename, chunk_size):
+    archive, member = split_archive_path(filename)
+    chunks = queue.Queue(maxsize=2)
+    stop = threading.Event()
 
-def load_and_prepare_word_list(filenames, group_characters, with_count=False, min_count=0):
-    names = ['text']
-    if with_count:
-        names.append('count')
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
 
-    df = pd.concat([pd.read_csv(filename, sep='\t', names=names, quoting=3, na_filter=False, dtype={'text': str, 'count': np.int32}) for filename in filenames], ignore_index=True)
+    def decompress():
+        try:
+            with open_archive_member(archive, member) as file:
+                rest = b''
 
-    if with_count:
-        if min_count > 0:
-            df = df[df['count'] >= min_count]
-        df.sort_values('count', inplace=True, ascending=False, ignore_index=True)
+                while block := file.read(chunk_size):
+                    block = rest + block
+                    newline = block.rfind(b'\n')
 
-    df['characters'] = df['text'].str.lower().map(set)
+                    if newline < 0:
+                        rest = block
+                    else:
+                        put(block[:newline + 1])
+                        rest = block[newline + 1:]
 
-    df['length'] = df['text'].str.len()
+                if rest:
+                    put(rest)
+        except Exception as error:
+            put(error)
 
-    df['group'] = df['characters'].map(lambda c : bisect.bisect(group_characters, c))
+        put(None)
+
+    thread = threading.Thread(target=decompress, daemon=True)
+    thread.start()
+
+    try:
+        while (chunk := chunks.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+def read_corpus_chunks(filename, names, chunk_size=1 << 24):
+    import pandas as pd
+
+    chunks = mapped_chunks(filename, chunk_size) if split_archive_path(filename)[0] is None else archive_chunks(filename, chunk_size)
+    empty = True
+
+    for chunk in chunks:
+        empty = False
+        yield pd.read_csv(io.BytesIO(chunk), sep='\t', names=names, quoting=3, na_filter=False, dtype={'text': str, 'count': np.int32})
+
+    if empty:
+        yield pd.DataFrame({name: pd.Series([], dtype=str if name == 'text' else np.int32) for name in names})
+
+def corpus_texts(filenames, distinct=False):
+    # with distinct=True texts repeating an earlier text (of any of the files) are skipped, see unseen_rows
+    import pandas as pd
+
+    seen = np.empty(0, dtype=np.uint64)
+
+    for filename in filenames:
+        for chunk in read_corpus_chunks(filename, ['text']):
+            texts = chunk['text'].to_numpy(dtype=object)
+
+            if distinct:
+                unseen, seen = unseen_rows(pd.util.hash_array(texts), seen)
+                texts = texts[unseen]
+
+            yield from texts
+
+# the texts of several corpora are merged: sentences are deduplicated while reading (by 64 bit hashes, collisions are
+# negligible for corpus sizes), the counts of words appearing in several corpora are summed up (optionally weighted)
+
+def unseen_rows(hashes, seen):
+    # the rows with the first occurrence of a hash not in the sorted array seen and the updated seen array
+    unique, first = np.unique(hashes, return_index=True)
+
+    if len(seen) > 0:
+        new = seen[np.minimum(np.searchsorted(seen, unique), len(seen) - 1)] != unique
+        unique = unique[new]
+        first = first[new]
+
+    # both arrays are sorted, so the stable sort (timsort) only merges them
+    return np.sort(first), np.sort(np.concatenate([seen, unique]), kind='stable')
+
+def merge_word_counts(df):
+    columns = {column: 'first' for column in df.columns if column != 'text'} | {'count': 'sum'}
+
+    return df.groupby('text', sort=False, as_index=False).agg(columns)[df.columns]
+
+def load_and_prepare_word_list(filenames, with_count=False, min_count=0, max_length=None, weights=None):
+    if weights is None:
+        weights = [1] * len(filenames)
+
+    fingerprint = corpus_fingerprint(filenames, 'words', with_count, min_count, max_length, list(weights))
+
+    df, alphabet = read_cached_table(fingerprint)
+
+    if df is None:
+        import pandas as pd
+
+        names = ['text']
+        if with_count:
+            names.append('count')
+
+        alphabet = ''
+        dfs = []
+        seen = np.empty(0, dtype=np.uint64)
+        duplicates = False
+
+        # the counts can only be filtered while reading if there is nothing to sum up
+        filter_count = with_count and min_count > 0 and len(filenames) == 1 and weights[0] == 1
+
+        for filename, weight in zip(filenames, weights):
+            for chunk in read_corpus_chunks(filename, names):
+                if filter_count:
+                    chunk = chunk[chunk['count'] >= min_count]
+
+                if with_count and weight != 1:
+                    chunk['count'] = np.rint(chunk['count'].to_numpy() * weight).astype(np.int64)
+
+                texts = list(chunk['text'])
+                codepoints, lengths = text_codepoints(texts)
+
+                keep = typeable_rows(codepoints, lengths)
+                if max_length is not None:
+                    keep &= lengths <= max_length
+
+                kept_rows = np.flatnonzero(keep)
+                unseen, seen = unseen_rows(pd.util.hash_array(np.array(texts, dtype=object)[kept_rows]), seen)
+
+                if len(unseen) < len(kept_rows):
+                    if with_count:
+                        duplicates = True
+                    else:
+                        keep[:] = False
+                        keep[kept_rows[unseen]] = True
+
+                codepoints = codepoints[np.repeat(keep, lengths)]
+                lengths = lengths[keep]
+
+                # the alphabet only grows, so the bits of the previous chunks stay valid
+                alphabet = extend_alphabet(alphabet, codepoints)
+
+                chunk_df = pd.DataFrame({'text': pd.Series([text for text, kept in zip(texts, keep) if kept], dtype=str)})
+                if with_count:
+                    chunk_df['count'] = chunk['count'].to_numpy()[keep]
+                chunk_df['length'] = lengths
+                chunk_df['lower_mask'], chunk_df['upper_mask'] = codepoint_masks(codepoints, lengths, alphabet)
+
+                dfs.append(chunk_df)
+
+        df = pd.concat(dfs, ignore_index=True)
+
+        if duplicates:
+            df = merge_word_counts(df)
+
+        if with_count and min_count > 0 and not filter_count:
+            df = df[df['count'] >= min_count].reset_index(drop=True)
+
+        if with_count:
+            df.sort_values('count', inplace=True, ascending=False, ignore_index=True, kind='stable')
+
+        df = Table.from_frame(df)
+
+        write_cached_table(fingerprint, df, alphabet)
+
+    df.attrs['fingerprint'] = fingerprint
+    df.attrs['alphabet'] = alphabet
+    df.attrs['filenames'] = list(filenames)
 
     return df
 
-def ngram_statistics(df, n=2):
-    stats = collections.defaultdict(int)
+# n-gram counting works on chunks of texts: the characters of a chunk are mapped to dense ids, n-grams are packed
+# into integer codes and counted with numpy, n-grams containing whitespace (or spanning two texts) are skipped
+
+def count_ngrams(texts, sizes=(2, 3), case_fold=False, chunk_size=100000):
+    stats = {n: collections.Counter() for n in sizes}
+    texts = iter(texts)
+
+    while chunk := list(itertools.islice(texts, chunk_size)):
+        if case_fold:
+            chunk = [text.lower() for text in chunk]
+
+        codepoints = np.frombuffer('\n'.join(chunk).encode('utf-32-le'), dtype=np.uint32)
+        characters, _ = character_counts(codepoints)
+
+        lookup = np.zeros(int(characters[-1]) + 1 if len(characters) > 0 else 0, dtype=np.int64)
+        lookup[characters] = np.arange(len(characters))
+        ids = lookup[codepoints]
+
+        character_strings = np.array([chr(c) for c in characters], dtype=object)
+        is_space = np.array([chr(c).isspace() for c in characters], dtype=np.int64)
+        space_count = np.concatenate(([0], np.cumsum(is_space[ids])))
+
+        base = len(characters)
+
+        for n in sizes:
+            if len(ids) < n:
+                continue
+
+            positions = np.flatnonzero(space_count[n:] == space_count[:-n])
+
+            if base ** n < 2 ** 63:
+                codes = np.zeros(len(positions), dtype=np.int64)
+                for k in range(n):
+                    codes = codes * base + ids[positions + k]
+                codes, counts = np.unique(codes, return_counts=True)
+                digits = np.stack([codes // base ** (n - k - 1) % base for k in range(n)], axis=1)
+            else:
+                digits, counts = np.unique(np.stack([ids[positions + k] for k in range(n)], axis=1), axis=0, return_counts=True)
+
+            stats[n].update(dict(zip(map(''.join, character_strings[digits]), counts.tolist())))
 
-    for text in df['text']:
-        for i in range(len(text) - n + 1):
-            ngram = text[i:i+n]
-            stats[ngram] += 1
-    
     return stats
 
-def prepare_ngram_list(sentence_df, group_characters, n=2):
-    stats = ngram_statistics(sentence_df, n)
+def prepare_ngram_lists(sentence_df, sizes=(2, 3)):
+    # the n-grams are counted over all distinct sentences of the corpora, not only the ones kept in sentence_df (duplicates
+    # are skipped like when loading the sentences)
+    # the masks are encoded against the alphabet of the sentences, which depends on the loaded sentences
+    filenames = sentence_df.attrs['filenames']
+    alphabet = sentence_df.attrs['alphabet']
+    fingerprints = {n: corpus_fingerprint(filenames, 'ngrams', n, alphabet) for n in sizes}
 
-    df = pd.DataFrame({'text': stats.keys(), 'count': stats.values()})
+    dfs = {n: read_cached_table(fingerprints[n])[0] for n in sizes}
 
-    df = df[~df['text'].str.contains(' ')]
+    if any(df is None for df in dfs.values()):
+        import pandas as pd
 
-    df.sort_values('count', inplace=True, ascending=False, ignore_index=True)
+        stats = count_ngrams(corpus_texts(filenames, distinct=True), sizes)
 
-    df['length'] = df['text'].str.len()
+        for n in sizes:
+            df = pd.DataFrame({'text': list(stats[n].keys()), 'count': np.fromiter(stats[n].values(), dtype=np.int64, count=len(stats[n]))})
 
-    df['group'] = df['text'].map(lambda c : bisect.bisect(group_characters, set(c)))
+            df.sort_values(['count', 'text'], inplace=True, ascending=[False, True], ignore_index=True)
 
-    return df
+            df['length'] = df['text'].str.len()
+            df['lower_mask'], df['upper_mask'] = text_masks(list(df['text']), alphabet)
+            df = Table.from_frame(df)
 
-# lesson generation/modification functions
-# Note: these use globals for now, should probably be turned into a class
+            write_cached_table(fingerprints[n], df, alphabet)
 
-def load_lesson(index = -1):
-    global current_lesson, current_lesson_index, existing_lessons
-    if index == -1:
-        current_lesson_index += 1
-    else:
-        current_lesson_index = index
+            dfs[n] = df
+
+    for df in dfs.values():
+        df.attrs['alphabet'] = alphabet
+
+    return dfs
+
+# the groups depend on the layout and are thus computed separately from the (shared) tables
+
+def word_groups(df, group_characters):
+    return assign_groups(df['lower_mask'] | df['upper_mask'], df.attrs['alphabet'], group_characters)
+
+def ngram_groups(df, group_characters):
+    # n-grams are case sensitive, the ones containing uppercase characters are never covered
+    upper_mask = df['upper_mask']
+    return assign_groups(df['lower_mask'] | np.where(upper_mask != 0, np.uint64(1 << overflow_bit), np.uint64(0)), df.attrs['alphabet'], group_characters)
+
+# typing effort: the ktouch keyboard layout files (layouts/<keyboardLayout>.xml) give the finger (fingerIndex, 0-3 left
+# hand, 4-7 right hand) and the position of every key, they are compiled into lookup arrays over the code points of the
+# characters, which score all consecutive character pairs of a table at once: same finger bigrams (different keys
+# typed with the same finger), row jumps (the same hand skipping a row) and hand alternation
+
+# penalties per character pair of the effort score for same finger, row jump and same hand
+effort_weights = (2, 1, 0.5)
+
+class KeyboardLayout:
+    def __init__(self, filename):
+        keys = [key for key in ET.parse(filename).getroot().iter('key') if key.get('fingerIndex') is not None]
+        characters = [(ord(char.text), index, KeyboardLayout.layer(char)) for index, key in enumerate(keys) for char in key.iter('char') if char.text is not None and len(char.text) == 1]
+
+        # a character on several keys (e.g. on a higher layer) uses the key of its lowest layer
+        characters.sort(key=lambda character: character[2])
+        codepoints, first = np.unique(np.array([codepoint for codepoint, _, _ in characters], dtype=np.uint32), return_index=True)
+        key_indices = np.array([index for _, index, _ in characters], dtype=np.int64)[first]
+
+        tops = np.array([int(key.get('top')) for key in keys])
+
+        # the index of every code point in the arrays below, -1 for characters not on the layout (the last entry)
+        self.lookup = np.full(int(codepoints[-1]) + 2 if len(codepoints) > 0 else 1, -1, dtype=np.int64)
+        self.lookup[codepoints] = np.arange(len(codepoints))
+
+        self.codepoints = codepoints
+        self.key = key_indices
+        self.finger = np.array([int(key.get('fingerIndex')) for key in keys])[key_indices]
+        self.hand = self.finger >= 4
+        self.row = np.searchsorted(np.unique(tops), tops)[key_indices]
+        self.column = np.array([int(key.get('left')) for key in keys])[key_indices]
+
+    @staticmethod
+    def layer(char):
+        modifier = char.get('modifier', '')
+
+        if modifier == '':
+            return 0 if char.get('position') in ('hidden', 'bottomLeft') else 2
+
+        return 1 if modifier.endswith('shift') else 3
+
+    def scores(self, texts):
+        codepoints, lengths = text_codepoints(list(texts))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        positions = self.lookup[np.minimum(codepoints, len(self.lookup) - 1)]
+        known = positions >= 0
+
+        # pairs of consecutive characters of the same text, both typed on the layout
+        first, second = positions[:-1], positions[1:]
+        pairs = known[:-1] & known[1:]
+        boundaries = offsets[1:-1]
+        pairs[boundaries[(boundaries > 0) & (boundaries < len(codepoints))] - 1] = False
+
+        same_hand = pairs & (self.hand[first] == self.hand[second])
+        same_finger = same_hand & (self.finger[first] == self.finger[second]) & (self.key[first] != self.key[second])
+        row_jumps = same_hand & (np.abs(self.row[first] - self.row[second]) >= 2)
+
+        # the pairs of a text start at its first character
+        segment_starts = np.minimum(offsets[:-1], max(len(codepoints) - 1, 0))
+        segment_ends = np.minimum(offsets[1:], max(len(codepoints) - 1, 0))
+
+        def per_text(values):
+            cumulative = np.concatenate([[0], np.cumsum(values, dtype=np.int64)])
+            return cumulative[segment_ends] - cumulative[segment_starts]
+
+        pair_counts = per_text(pairs)
+        same_hand_counts = per_text(same_hand)
+        same_finger_counts = per_text(same_finger)
+        row_jump_counts = per_text(row_jumps)
+
+        divisor = np.maximum(pair_counts, 1)
+
+        return {
+            'same_finger': same_finger_counts.astype(np.int32),
+            'row_jumps': row_jump_counts.astype(np.int32),
+            'hand_alternation': ((pair_counts - same_hand_counts) / divisor).astype(np.float32),
+            'effort': ((effort_weights[0] * same_finger_counts + effort_weights[1] * row_jump_counts + effort_weights[2] * same_hand_counts) / divisor).astype(np.float32),
+        }
+
+# adaptive drills: ktouch stores the errors of every training run per expected character in its profile database
+# (~/.local/share/ktouch/profiles.db), related to the typed characters distributed by the character frequencies of the
+# corpus they give an error rate per character. ktouch doesn't record the preceding character, so the weakness of a
+# bigram, word or sentence is the mean error rate of its characters.
+
+def read_error_statistics(filename, profile=None):
+    import sqlite3
+    import urllib.parse
+
+    connection = sqlite3.connect(f'file:{urllib.parse.quote(os.path.abspath(filename))}?mode=ro', uri=True)
+
+    try:
+        # the column of the expected character differs between ktouch versions
+        columns = [column[1] for column in connection.execute('PRAGMA table_info(training_stats_errors)')]
+        character_column = 'expected_char' if 'expected_char' in columns else 'character'
+
+        condition, parameters = ('', ()) if profile is None else ('WHERE profile_id IN (SELECT id FROM profiles WHERE name = ?)', (profile,))
+        typed = connection.execute(f'SELECT COALESCE(SUM(characters_typed), 0) FROM training_stats {condition}', parameters).fetchone()[0]
+        errors = connection.execute(f'SELECT {character_column}, SUM(count) FROM training_stats_errors WHERE stats_id IN (SELECT id FROM training_stats {condition}) GROUP BY {character_column}', parameters).fetchall()
+    finally:
+        connection.close()
+
+    return {character: count for character, count in errors if isinstance(character, str) and len(character) == 1}, typed
+
+def character_weakness(errors, typed, bigrams_df):
+    # error rate per code point, the last entry (0) is used for all larger code points
+    codepoints, _ = text_codepoints(list(bigrams_df['text']))
+    frequencies = np.bincount(codepoints, weights=np.repeat(bigrams_df['count'], 2))
+
+    size = max([len(frequencies)] + [ord(character) + 1 for character in errors]) + 1
+    expected = np.zeros(size)
+    expected[:len(frequencies)] = typed * frequencies / max(frequencies.sum(), 1)
+
+    weakness = np.zeros(size)
+    for character, count in errors.items():
+        weakness[ord(character)] = count
+
+    return weakness / (expected + 1)
+
+# index of the word and sentence tables, so that lesson queries don't have to scan the whole tables
+# all queries return sorted row ids, which keeps the order of the tables (i.e. by count for words)
+
+def intersect_rows(rows, other_rows):
+    if len(rows) > len(other_rows):
+        rows, other_rows = other_rows, rows
+
+    if len(other_rows) == 0:
+        return other_rows
+
+    positions = np.searchsorted(other_rows, rows).clip(max=len(other_rows) - 1)
+
+    return rows[other_rows[positions] == rows]
+
+class Buckets:
+    def __init__(self, values):
+        self.keys, inverse = np.unique(values, return_inverse=True, axis=0 if np.ndim(values) > 1 else None)
+        self.order = np.argsort(inverse, kind='stable')
+        self.starts = np.searchsorted(inverse[self.order], np.arange(len(self.keys) + 1))
+
+    def rows(self, selected):
+        selected = np.flatnonzero(selected)
+
+        if len(selected) == 1:
+            return self.order[self.starts[selected[0]]:self.starts[selected[0] + 1]]
 
-    existing_lesson = existing_lessons[current_lesson_index]
-    current_lesson['text'] = existing_lesson['text']
-    current_lesson['title'] = existing_lesson['title']
+        return np.sort(np.concatenate([self.order[self.starts[key]:self.starts[key + 1]] for key in selected] + [self.order[:0]]))
 
-def translate_title(required_length=1):
-    global current_lesson, translation_table
-    current_lesson['title'] = ' '.join([x.translate(translation_table) if len(x) == required_length else x for x in current_lesson['title'].split(' ')])
+class CorpusIndex:
+    def __init__(self, df, with_words=True):
+        texts = df['text']
 
-def replace_title(from_text, to_text):
-    global current_lesson
-    current_lesson['title'] = current_lesson['title'].replace(from_text, to_text)
+        self.rows = np.arange(len(df))
+        self.length = Buckets(df['length'])
+        self.masks = Buckets(np.stack([df['lower_mask'], df['upper_mask']], axis=1))
 
-def translate_text():
-    global current_lesson, translation_table
-    current_lesson['text'] = current_lesson['text'].translate(translation_table)
+        if with_words:
+            lower_texts = [text.lower() for text in texts]
 
-def finish_lesson():
-    global current_lesson, lessons
-    lessons.append(current_lesson)
-    current_lesson = {}
+            self.is_upper = np.fromiter((text == text.upper() for text in texts), dtype=bool, count=len(texts))
+            self.is_lower = df['upper_mask'] == 0
+            self.first_letter = Buckets(np.array([text[:1] for text in texts], dtype=object))
+            self.first_lower_letter = Buckets(np.array([text[:1] for text in lower_texts], dtype=object))
 
-def next_group():
-    global current_lesson, current_group, groups, uppercase_learned
-    current_group += 1
-    current_lesson['newCharacters'] = groups[current_group]
-    if uppercase_learned:
-        current_lesson['newCharacters'] += groups[current_group].replace('ß', '').upper()
+            # the codes of the lowercase texts in the order of their first occurrence
+            codes = {}
+            self.lower_text_codes = np.fromiter((codes.setdefault(text, len(codes)) for text in lower_texts), dtype=np.int64, count=len(lower_texts))
 
-def limit_and_translate_lines(lines):
-    global current_lesson
+    def length_rows(self, min_length=0, max_length=1000):
+        return self.length.rows((self.length.keys >= min_length) & (self.length.keys <= max_length))
 
-    current_lesson['text'] = '\n'.join(current_lesson['text'].split('\n')[:lines])
+    def first_letter_rows(self, letters, lower=False):
+        buckets = self.first_lower_letter if lower else self.first_letter
+        return buckets.rows(np.isin(buckets.keys, list(letters)))
 
-    translate_text()
+    def mask_rows(self, allowed_lower, allowed_upper, contain_lower=None, contain_upper=None):
+        lower_masks = self.masks.keys[:, 0]
+        upper_masks = self.masks.keys[:, 1]
 
-def lesson_wrapper(lesson_generator, *args, callback=None, title_translate=1, new_group=False, title=None, limit_translated_lines=None, lesson_characters=None, **kwargs):
-    load_lesson()
+        selected = ((lower_masks & ~allowed_lower) == 0) & ((upper_masks & ~allowed_upper) == 0)
 
-    if new_group:
-        next_group()
+        if contain_lower is not None:
+            selected &= ((lower_masks & contain_lower) | (upper_masks & contain_upper)) != 0
 
-    if lesson_characters is not None:
-        current_lesson['newCharacters'] = lesson_characters
+        return self.masks.rows(selected)
 
-    if limit_translated_lines is not None:
-        limit_and_translate_lines(limit_translated_lines)
+    def unique_rows(self, rows, lower=False):
+        # the texts themselves are unique after loading
+        if not lower:
+            return rows
 
-    if title_translate is not None:
-        translate_title(1)
+        _, first = np.unique(self.lower_text_codes[rows], return_index=True)
 
-    lesson_generator(*args, **kwargs)
+        return rows[np.sort(first)]
 
-    if title is not None:
-        current_lesson['title'] = title
+# the corpus data shared by all courses generated with it
 
-    if callback is not None:
-        callback()
+class Corpus:
+    def __init__(self, names):
+        # a corpus is given by its name or as [name, weight] to weight its word counts
+        self.names = [name if isinstance(name, str) else name[0] for name in names]
+        self.weights = [1 if isinstance(name, str) else name[1] for name in names]
 
-    finish_lesson()
+        word_lists = [corpus_filename(name, 'words') for name in self.names]
+        sentence_lists = [corpus_filename(name, 'sentences') for name in self.names]
 
-def letter_translate_lesson():
-    translate_text()
+        with profile_stage('load words'):
+            self.word_df = load_and_prepare_word_list(word_lists, True, 10, weights=self.weights)
+            profile_rows(len(self.word_df))
+
+        with profile_stage('load sentences'):
+            self.sentence_df = load_and_prepare_word_list(sentence_lists, max_length=max_sentence_length)
+            profile_rows(len(self.sentence_df))
+
+        with profile_stage('prepare n-grams'):
+            self.ngram_dfs = prepare_ngram_lists(self.sentence_df)
+            profile_rows(sum(map(len, self.ngram_dfs.values())))
+
+        with profile_stage('build index'):
+            self.word_index = CorpusIndex(self.word_df)
+            self.sentence_index = CorpusIndex(self.sentence_df, with_words=False)
+            profile_rows(len(self.word_df) + len(self.sentence_df))
+
+# cache of generated lessons: a lesson is only generated again if its inputs (the arguments of lesson_wrapper,
+# the state of the course, the layout, the corpus or the code of the script apart from the lesson sequence) changed
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint():
+    with open(__file__, encoding='utf-8') as file:
+        source = file.read()
+
+    return hashlib.sha1(source.replace(inspect.getsource(CourseBuilder.build), '').encode()).hexdigest()
+
+def code_key(code):
+    return (code.co_code, tuple(code_key(c) if inspect.iscode(c) else c for c in code.co_consts), code.co_names)
+
+def callable_key(function):
+    if function is None:
+        return None
+
+    if isinstance(function, functools.partial):
+        return (callable_key(function.func), function.args, sorted(function.keywords.items()))
+
+    if getattr(function, '__name__', None) == '<lambda>':
+        return code_key(function.__code__)
+
+    return function.__qualname__
+
+def lesson_key(*inputs):
+    return hashlib.sha1(repr((code_fingerprint(),) + inputs).encode()).hexdigest()
+
+class LessonCache:
+    # only the lessons used by the last run are kept
+    # besides the lesson an entry stores the sentences it used and the state of the used sentences it was generated with
+    def __init__(self, filename):
+        self.filename = filename
+        self.used = {}
+
+        try:
+            with open(filename, encoding='utf-8') as file:
+                self.lessons = json.load(file)
+        except (OSError, ValueError):
+            self.lessons = {}
+
+    def get(self, key):
+        entry = self.lessons.get(key)
+
+        if entry is not None:
+            self.used[key] = entry
+
+        return entry
+
+    def put(self, key, lesson, sentences=(), sentence_state=None):
+        self.used[key] = {'lesson': dict(lesson), 'sentences': list(sentences), 'sentence_state': sentence_state}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+        temporary_filename = f'{self.filename}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_filename, 'w', encoding='utf-8') as file:
+            json.dump(self.used, file, ensure_ascii=False)
+
+        os.replace(temporary_filename, self.filename)
+
+def lesson_cache_filename(output_filename):
+    if cache_directory is None:
+        return None
+
+    return os.path.join(cache_directory, 'lessons', hashlib.sha1(os.path.abspath(output_filename).encode()).hexdigest() + '.json')
+
+# lesson generation/modification functions
+# the state of the course being generated is owned by a CourseBuilder, the corpus data is shared (read-only),
+# so that several builders can run concurrently
+
+# the lines are laid out greedily by a generator, so arbitrarily long texts can be streamed; the width of a word
+# (with the following space) is computed once per word and not per repetition and without punctuation all repetitions
+# of a word fitting into a line are added at once. The punctuation is drawn per word as before (random() and choice()
+# of the random module or of the given generator), so the same seed gives the same text as before.
+
+def layout_lines(words, repeats=10, line_length=60, random_post_insert=",.", random_post_insert_probability=0, random_generator=random):
+    if not isinstance(words, list):
+        words = list(words)
+
+    if not words:
+        return
 
-def repeat_words(words, repeats=10, line_length=60, line_count=30, random_post_insert=",.", random_post_insert_probability=0):
-    lines = []
-    repeated = 0
     current_word = 0
-    current_word_length = len(words[current_word])
+    word = words[0]
+    width = len(word) + 1
+    remaining = repeats
+
+    draw = random_generator.random
+    choose = random_generator.choice
+    characters = list(random_post_insert)
+
+    # the widths include the space after each word, so the line may be one longer
+    line_length += 1
+
+    while True:
+        line = []
+        free = line_length
+
+        if random_post_insert_probability > 0:
+            while width <= free:
+                # no punctuation after the last word of a line
+                if width < free and draw() <= random_post_insert_probability:
+                    line.append(word + choose(characters))
+                    free -= width + 1
+                else:
+                    line.append(word)
+                    free -= width
+
+                remaining -= 1
+
+                if remaining == 0:
+                    current_word += 1
+                    if current_word == len(words):
+                        current_word = 0
+                    word = words[current_word]
+                    width = len(word) + 1
+                    remaining = repeats
+        else:
+            while width <= free:
+                count = free // width
 
-    while len(lines) < line_count:
-        current_line = []
-        current_line_length = 0
+                if count < remaining:
+                    line += [word] * count
+                    free -= width * count
+                    remaining -= count
+                    continue
 
-        while current_line_length + current_word_length <= line_length:
-            if random_post_insert_probability > 0 and current_line_length + current_word_length < line_length:
-                if random.random() <= random_post_insert_probability:
-                    current_line.append(words[current_word] + random.choice(random_post_insert))
-                    current_line_length += current_word_length + 2
+                if remaining == 1:
+                    line.append(word)
                 else:
-                    current_line.append(words[current_word])
-                    current_line_length += current_word_length + 1
-            else:
-                current_line.append(words[current_word])
-                current_line_length += current_word_length + 1
-            repeated += 1
+                    line += [word] * remaining
+                free -= width * remaining
 
-            if repeated == repeats:
-                current_word = (current_word + 1) % len(words)
-                current_word_length = len(words[current_word])
-                repeated = 0
+                current_word += 1
+                if current_word == len(words):
+                    current_word = 0
+                word = words[current_word]
+                width = len(word) + 1
+                remaining = repeats
+
+        yield ' '.join(line)
+
+def repeat_words(words, repeats=10, line_length=60, line_count=30, random_post_insert=",.", random_post_insert_probability=0, random_generator=random):
+    return '\n'.join(itertools.islice(layout_lines(words, repeats, line_length, random_post_insert, random_post_insert_probability, random_generator), line_count))
+
+# coverage selection: with a limited number of lines, the words (or bigrams) are chosen greedily by the summed weight
+# of the not yet covered target n-grams they contain per character they take up in the lesson (budgeted maximum
+# coverage). The n-grams of all texts are packed into integer codes (21 bits per code point) and matched against the
+# targets at once, the greedy choice is evaluated lazily: a popped gain is only recomputed and pushed back if it dropped
+# below the best remaining one.
 
-        lines.append(' '.join(current_line))
+def ngram_codes(codepoints, lengths, n):
+    # the codes of all n-grams within the texts and the index of their text
+    ends = np.cumsum(lengths)
+    texts = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.flatnonzero(np.arange(len(codepoints)) + n <= ends[texts])
 
-    return '\n'.join(lines)
+    codes = np.zeros(len(positions), dtype=np.uint64)
+    for k in range(n):
+        codes |= codepoints[positions + k].astype(np.uint64) << np.uint64(21 * k)
 
-def bigram_lesson():
-    global bigrams_df, current_group, group_characters, current_lesson
+    return codes, texts[positions]
 
-    current_bigrams = bigrams_df[bigrams_df['group'] <= current_group]
-    bigram_selection = pd.concat([current_bigrams[current_bigrams['text'].str.contains(f'{letter}[^{letter}]')][:4] for letter in group_characters[current_group]], ignore_index=True)
-    current_lesson['text'] = repeat_words(bigram_selection['text'], 9, 59, 29)
+def coverage_order(texts, costs, targets, weights, budget):
+    weights = np.asarray(weights, dtype=np.float64)
+    costs = np.asarray(costs, dtype=np.float64)
+    codepoints, lengths = text_codepoints(texts)
+    target_codepoints, target_lengths = text_codepoints(targets)
 
-def word_lesson(repeats, line_count, current_group_only=False, min_letter_count=0, max_letter_count=100, start_letters=False, filter_uppercase_words=False, lower=False, drop_duplicates=True, random_post_insert=",.", random_post_insert_probability=0, max_line_length=60, skip_words=None, append=False):
-    global word_df, current_group, group_characters, current_lesson, groups
+    hit_texts = [np.zeros(0, dtype=np.int64)]
+    hit_targets = [np.zeros(0, dtype=np.int64)]
 
-    if current_group_only:
-        words = word_df[word_df['group'] == current_group]
-    else:
-        words = word_df[word_df['group'] <= current_group]
+    for n in np.unique(target_lengths):
+        target_indices = np.flatnonzero(target_lengths == n)
+        target_starts = (np.cumsum(target_lengths) - target_lengths)[target_indices]
+        target_codes = np.zeros(len(target_indices), dtype=np.uint64)
+        for k in range(n):
+            target_codes |= target_codepoints[target_starts + k].astype(np.uint64) << np.uint64(21 * k)
+        order = np.argsort(target_codes)
+        target_codes = target_codes[order]
+
+        codes, code_texts = ngram_codes(codepoints, lengths, n)
+        found = np.minimum(np.searchsorted(target_codes, codes), len(target_codes) - 1)
+        matches = target_codes[found] == codes
+
+        hit_texts.append(code_texts[matches])
+        hit_targets.append(target_indices[order[found[matches]]])
+
+    # the distinct targets of every text, sorted by text
+    hit_texts, hit_targets = np.divmod(np.unique(np.concatenate(hit_texts) * max(len(targets), 1) + np.concatenate(hit_targets)), max(len(targets), 1))
+    starts = np.searchsorted(hit_texts, np.arange(len(texts) + 1))
+
+    gains = np.bincount(hit_texts, weights=weights[hit_targets], minlength=len(texts))
+    heap = [(-gain / costs[text], text) for text, gain in zip(np.flatnonzero(gains > 0).tolist(), gains[gains > 0].tolist())]
+    heapq.heapify(heap)
+
+    covered = np.zeros(len(targets), dtype=bool)
+    selection = []
+    spent = 0
+
+    while heap and not covered.all():
+        _, text = heapq.heappop(heap)
+
+        if spent + costs[text] > budget:
+            continue
+
+        text_targets = hit_targets[starts[text]:starts[text + 1]]
+        gain = weights[text_targets[~covered[text_targets]]].sum()
+
+        if gain <= 0:
+            continue
+
+        if heap and gain / costs[text] < -heap[0][0]:
+            heapq.heappush(heap, (-gain / costs[text], text))
+            continue
+
+        selection.append(text)
+        covered[text_targets] = True
+        spent += costs[text]
+
+    # the remaining texts follow in their original order
+    rest = np.ones(len(texts), dtype=bool)
+    rest[selection] = False
+
+    return np.concatenate((np.array(selection, dtype=np.int64), np.flatnonzero(rest)))
+
+class CourseBuilder:
+    def __init__(self, corpus_data, layout, lesson_writer=None, lesson_cache=None):
+        self.corpus = corpus_data
+        self.lesson_writer = lesson_writer
+        self.lesson_cache = lesson_cache
+        self.existing_lessons = read_lessons(neo_course_filename)
+
+        keys = layout['keys']
+        hands = layout['hands']
+
+        self.layout_filename = layout.get('layout_filename', f"{layout_directory}/{layout['course']['keyboardLayout'].replace('(', '.').replace(')', '')}.xml")
+        self.keyboard_layout = None
+        self.effort = {}
+        self.weakness = None
+
+        try:
+            with open(self.layout_filename, 'rb') as file:
+                layout_fingerprint = hashlib.sha1(file.read()).hexdigest()
+        except OSError:
+            layout_fingerprint = None
+
+        self.layout_key = (keys, hands, neo_keys, layout_fingerprint, corpus_data.word_df.attrs['fingerprint'], corpus_data.sentence_df.attrs['fingerprint'])
+
+        self.groups = keys.split(' ')
+
+        self.group_characters = list(itertools.accumulate(self.groups))
+
+        self.translation_table = {ord(neo_key): key for neo_key, key in zip(neo_keys, keys)} | {ord(neo_key.upper()): key.upper() for neo_key, key in zip(neo_keys, keys) if neo_key not in ',.ß' and key not in ',.ß'}
+        self.hand_table = {key: hand for key, hand in zip(keys, hands)}
+
+        self.word_df = corpus_data.word_df
+        self.word_index = corpus_data.word_index
+        self.sentence_df = corpus_data.sentence_df
+        self.sentence_index = corpus_data.sentence_index
+        self.bigrams_df = corpus_data.ngram_dfs[2]
+
+        with profile_stage('assign groups'):
+            self.word_group_buckets = Buckets(word_groups(self.word_df, self.group_characters))
+            self.bigram_groups = ngram_groups(self.bigrams_df, self.group_characters)
+            profile_rows(len(self.word_df) + len(self.bigrams_df))
+
+        # the groups of the other n-gram tables are only assigned for the coverage selection
+        self.ngram_groups = {2: self.bigram_groups}
+
+        self.seed = layout.get('seed')
+        self.reset()
+
+    def reset(self, seed=None):
+        self.lessons = []
+        self.current_lesson_index = -1
+        self.current_group = -1
+        self.current_lesson = {}
+        self.uppercase_learned = False
 
-    if min_letter_count > 0 or max_letter_count < 100:
-        words = words[(words['length'] >= min_letter_count) & (words['length'] <= max_letter_count)]
+        if seed is not None:
+            self.seed = seed
 
-    if filter_uppercase_words:
-        words = words[words['text'] != words['text'].str.upper()]
+        # every lesson of lesson_wrapper gets its own generator (for the sentences and the punctuation of the word lessons),
+        # derived from the seed of the course and the lesson index like the children of SeedSequence.spawn, so that the
+        # lessons don't depend on the order they are generated in, without a seed the entropy is drawn once per course
+        self.seed_sequence = np.random.SeedSequence(self.seed)
+        self.random = np.random.default_rng(self.seed_sequence)
+        self.used_sentences = np.zeros(len(self.sentence_df), dtype=bool)
+        self.lesson_sentences = []
+        self.lesson_sentence_state = None
 
-    if lower:
-        if uppercase_learned:
-            words = words[words['text'] == words['text'].str.lower()]
+    def load_lesson(self, index = -1):
+        if index == -1:
+            self.current_lesson_index += 1
         else:
-            words['text'] = words['text'].str.lower()
+            self.current_lesson_index = index
+
+        existing_lesson = self.existing_lessons[self.current_lesson_index]
+        self.current_lesson['text'] = existing_lesson['text']
+        self.current_lesson['title'] = existing_lesson['title']
+
+    def translate_title(self, required_length=1):
+        self.current_lesson['title'] = ' '.join([x.translate(self.translation_table) if len(x) == required_length else x for x in self.current_lesson['title'].split(' ')])
+
+    def replace_title(self, from_text, to_text):
+        self.current_lesson['title'] = self.current_lesson['title'].replace(from_text, to_text)
+
+    def translate_text(self):
+        self.current_lesson['text'] = self.current_lesson['text'].translate(self.translation_table)
+
+    def finish_lesson(self):
+        self.lessons.append(self.current_lesson)
+        if self.lesson_writer is not None:
+            self.lesson_writer(self.current_lesson)
+        self.current_lesson = {}
+
+    def next_group(self):
+        self.current_group += 1
+        self.current_lesson['newCharacters'] = self.groups[self.current_group]
+        if self.uppercase_learned:
+            self.current_lesson['newCharacters'] += self.groups[self.current_group].replace('ß', '').upper()
+
+    def limit_and_translate_lines(self, lines):
+        self.current_lesson['text'] = '\n'.join(self.current_lesson['text'].split('\n')[:lines])
+
+        self.translate_text()
+
+    def lesson_wrapper(self, lesson_generator, *args, callback=None, title_translate=1, new_group=False, title=None, limit_translated_lines=None, lesson_characters=None, **kwargs):
+        with profile_stage(f'lesson {self.current_lesson_index + 1} {lesson_generator.__name__}') as record:
+            self.load_lesson()
+
+            if record is not None:
+                record['stage'] += f": {self.existing_lessons[self.current_lesson_index]['title']}"
+
+            if new_group:
+                self.next_group()
+
+            self.lesson_sentences = []
+            self.lesson_sentence_state = None
+            self.random = np.random.default_rng(np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(self.current_lesson_index,)))
+
+            if self.lesson_cache is not None:
+                key = lesson_key(self.layout_key, self.seed, self.existing_lessons[self.current_lesson_index], self.current_lesson_index, self.current_group, self.uppercase_learned,
+                    callable_key(lesson_generator), args, sorted(kwargs.items()), callable_key(callback), title_translate, title, limit_translated_lines, lesson_characters)
+
+                # a lesson with sentences can only be reused if the same sentences were used before it
+                entry = self.lesson_cache.get(key)
+                if entry is not None and entry['sentence_state'] in (None, self.sentence_state()):
+                    if record is not None:
+                        record['cached'] = True
+                    self.used_sentences[entry['sentences']] = True
+                    self.current_lesson = dict(entry['lesson'])
+                    self.finish_lesson()
+                    return
+
+            if lesson_characters is not None:
+                self.current_lesson['newCharacters'] = lesson_characters
 
-    if start_letters:
-        if isinstance(start_letters, str):
-            words = words[words['text'].str.contains(f'^[{start_letters}]')]
+            if limit_translated_lines is not None:
+                self.limit_and_translate_lines(limit_translated_lines)
+
+            if title_translate is not None:
+                self.translate_title(1)
+
+            lesson_generator(*args, **kwargs)
+
+            if title is not None:
+                self.current_lesson['title'] = title
+
+            if callback is not None:
+                callback()
+
+            if self.lesson_cache is not None:
+                self.lesson_cache.put(key, self.current_lesson, np.concatenate(self.lesson_sentences).tolist() if self.lesson_sentences else [], self.lesson_sentence_state)
+
+            self.finish_lesson()
+
+    def letter_translate_lesson(self):
+        self.translate_text()
+
+    def effort_rows(self, table, rows, max_same_finger=None, max_row_jumps=None, sort_by_effort=False):
+        # filters the rows by the typing effort scores of the layout or sorts them by effort (ties keep the order by count)
+        if max_same_finger is None and max_row_jumps is None and not sort_by_effort:
+            return rows
+
+        if table not in self.effort:
+            if self.keyboard_layout is None:
+                if not os.path.exists(self.layout_filename):
+                    raise ValueError(f'the typing effort options need the keyboard layout file {self.layout_filename}')
+                self.keyboard_layout = KeyboardLayout(self.layout_filename)
+
+            with profile_stage(f'score {table}'):
+                self.effort[table] = self.keyboard_layout.scores((self.word_df if table == 'words' else self.bigrams_df)['text'])
+                profile_rows(len(self.effort[table]))
+
+        scores = self.effort[table]
+
+        if max_same_finger is not None:
+            rows = rows[scores['same_finger'][rows] <= max_same_finger]
+
+        if max_row_jumps is not None:
+            rows = rows[scores['row_jumps'][rows] <= max_row_jumps]
+
+        if sort_by_effort:
+            rows = rows[np.argsort(scores['effort'][rows], kind='stable')]
+
+        return rows
+
+    def weak_rows(self, df, rows):
+        # sorts the rows by the mean weakness of their characters, weighted with the logarithm of their count if the table has counts
+        if self.weakness is None:
+            raise ValueError('the weak lessons need the error statistics of ktouch (see --drill)')
+
+        codepoints, lengths = text_codepoints(list(df['text'][rows]))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        cumulative = np.concatenate([[0], np.cumsum(self.weakness[np.minimum(codepoints, len(self.weakness) - 1)])])
+
+        scores = (cumulative[offsets[1:]] - cumulative[offsets[:-1]]) / np.maximum(lengths, 1)
+
+        if 'count' in df:
+            scores *= np.log1p(df['count'][rows])
+
+        return rows[np.argsort(-scores, kind='stable')]
+
+    def coverage_targets(self):
+        # the most frequent n-grams containing characters of the current group, weighted relative to the n-grams of the same size
+        targets = []
+        weights = []
+
+        for n, df in self.corpus.ngram_dfs.items():
+            if n not in self.ngram_groups:
+                self.ngram_groups[n] = ngram_groups(df, self.group_characters)
+
+            rows = np.flatnonzero(self.ngram_groups[n] == self.current_group)[:coverage_ngrams]
+            counts = df['count'][rows]
+
+            targets += list(df['text'][rows])
+            weights.append(counts / max(counts.sum(), 1))
+
+        return targets, np.concatenate(weights)
+
+    def bigram_lesson(self, max_same_finger=None, max_row_jumps=None, sort_by_effort=False, coverage=False, weak=False):
+        rows = self.effort_rows('bigrams', np.flatnonzero(self.bigram_groups <= self.current_group), max_same_finger, max_row_jumps, sort_by_effort)
+
+        if weak:
+            rows = self.weak_rows(self.bigrams_df, rows)
+
+        profile_rows(len(self.bigrams_df))
+
+        # bigrams of two different characters
+        bigrams = [bigram for bigram in self.bigrams_df['text'][rows] if bigram[0] != bigram[1]]
+
+        if coverage:
+            # instead of 4 bigrams per letter (more than fit into the lesson for later groups) the new ones come first
+            bigram_selection = [bigrams[i] for i in coverage_order(bigrams, [9 * 3] * len(bigrams), *self.coverage_targets(), 29 * 60)]
+        elif weak:
+            # the weakest bigrams of all letters
+            bigram_selection = bigrams
         else:
-            words = words[words['text'].str.contains(f'^[{groups[current_group]}]')]
+            first_bigrams = collections.defaultdict(list)
+            for bigram in bigrams:
+                if len(first_bigrams[bigram[0]]) < 4:
+                    first_bigrams[bigram[0]].append(bigram)
 
-    if drop_duplicates:
-        words = words.drop_duplicates(subset=['text'], keep='first')
+            bigram_selection = [bigram for letter in self.group_characters[self.current_group] for bigram in first_bigrams[letter]]
 
-    if skip_words is not None:
-        words = words[skip_words:]
+        self.current_lesson['text'] = repeat_words(bigram_selection, 9, 59, 29)
 
-    text = repeat_words(words['text'].array, repeats, max_line_length, line_count, random_post_insert, random_post_insert_probability)
+    def word_lesson(self, repeats, line_count, current_group_only=False, min_letter_count=0, max_letter_count=100, start_letters=False, filter_uppercase_words=False, lower=False, drop_duplicates=True, random_post_insert=",.", random_post_insert_probability=0, max_line_length=60, skip_words=None, max_same_finger=None, max_row_jumps=None, sort_by_effort=False, coverage=False, weak=False, append=False):
+        rows = self.word_group_buckets.rows(self.word_group_buckets.keys == self.current_group if current_group_only else self.word_group_buckets.keys <= self.current_group)
+        profile_rows(len(rows))
 
-    if append:
-        current_lesson['text'] += '\n' + text
-    else:
-        current_lesson['text'] = text
+        if min_letter_count > 0 or max_letter_count < 100:
+            rows = intersect_rows(rows, self.word_index.length_rows(min_letter_count, max_letter_count))
 
-def multi_word_lesson(repeats_list, lines_list, append=False, **kwargs):
-    global current_lesson
+        if filter_uppercase_words:
+            rows = rows[~self.word_index.is_upper[rows]]
 
-    if not append:
-        current_lesson['text'] = ''
+        lowered = False
 
-    min_letter_count = 0
-    max_letter_count = 100
+        if lower:
+            if self.uppercase_learned:
+                rows = rows[self.word_index.is_lower[rows]]
+            else:
+                lowered = True
 
-    if 'min_letter_count' in kwargs:
-        min_letter_count = kwargs['min_letter_count']
+        if start_letters:
+            if not isinstance(start_letters, str):
+                start_letters = self.groups[self.current_group]
+            rows = intersect_rows(rows, self.word_index.first_letter_rows(start_letters, lowered))
 
-    if not hasattr(min_letter_count, '__iter__'):
-        min_letter_count = itertools.repeat(min_letter_count)
-    
-    if 'max_letter_count' in kwargs:
-        max_letter_count = kwargs['max_letter_count']
+        if drop_duplicates:
+            rows = self.word_index.unique_rows(rows, lowered)
 
-    if not hasattr(max_letter_count, '__iter__'):
-        max_letter_count = itertools.repeat(max_letter_count)
-    
-    for repeats, lines, min_letters, max_letters in zip(repeats_list, lines_list, min_letter_count, max_letter_count):
-        kwargs['min_letter_count'] = min_letters
-        kwargs['max_letter_count'] = max_letters
-        word_lesson(repeats, lines, **kwargs, append=append)
-        append=True
+        rows = self.effort_rows('words', rows, max_same_finger, max_row_jumps, sort_by_effort)
 
-def letters_for_hand(hand, upper=True):
-    global group_characters, current_group, hand_table
-    result = ''.join([character for character in group_characters[current_group] if hand_table[character] == hand and character != character.upper()])
+        if weak:
+            rows = self.weak_rows(self.word_df, rows)
 
-    if upper:
-        result = result.replace('ß', 'ẞ').upper()
+        if skip_words is not None:
+            rows = rows[skip_words:]
 
-    return result
+        words = list(self.word_df['text'][rows])
+
+        if lowered:
+            words = [word.lower() for word in words]
+
+        if coverage:
+            words = [words[i] for i in coverage_order(words, [repeats * (len(word) + 1) for word in words], *self.coverage_targets(), line_count * (max_line_length + 1))]
+
+        text = repeat_words(words, repeats, max_line_length, line_count, random_post_insert, random_post_insert_probability, self.random)
+
+        if append:
+            self.current_lesson['text'] += '\n' + text
+        else:
+            self.current_lesson['text'] = text
+
+    def multi_word_lesson(self, repeats_list, lines_list, append=False, **kwargs):
+        if not append:
+            self.current_lesson['text'] = ''
+
+        min_letter_count = 0
+        max_letter_count = 100
+
+        if 'min_letter_count' in kwargs:
+            min_letter_count = kwargs['min_letter_count']
+
+        if not hasattr(min_letter_count, '__iter__'):
+            min_letter_count = itertools.repeat(min_letter_count)
+
+        if 'max_letter_count' in kwargs:
+            max_letter_count = kwargs['max_letter_count']
 
-def sentence_lesson(count, max_length=1000, character_filter=None, must_contain=None, append=False):
-    global sentence_df, current_group, group_characters, current_lesson, groups
+        if not hasattr(max_letter_count, '__iter__'):
+            max_letter_count = itertools.repeat(max_letter_count)
 
-    sentences = sentence_df
+        for repeats, lines, min_letters, max_letters in zip(repeats_list, lines_list, min_letter_count, max_letter_count):
+            kwargs['min_letter_count'] = min_letters
+            kwargs['max_letter_count'] = max_letters
+            self.word_lesson(repeats, lines, **kwargs, append=append)
+            append=True
 
-    if character_filter is None:
-        character_filter = ''.join(group_characters[current_group])
-        character_filter += character_filter.upper() + ' '
+    def letters_for_hand(self, hand, upper=True):
+        result = ''.join([character for character in self.group_characters[self.current_group] if self.hand_table[character] == hand and character != character.upper()])
 
-    if max_length < 1000:
-        sentences = sentences[sentences['length'] <= max_length]
+        if upper:
+            result = result.replace('ß', 'ẞ').upper()
+
+        return result
+
+    def sentence_lesson(self, count, max_length=1000, character_filter=None, must_contain=None, weak=False, append=False):
+        alphabet = self.sentence_df.attrs['alphabet']
+
+        if character_filter is None:
+            character_filter = ''.join(self.group_characters[self.current_group])
+            character_filter += character_filter.upper() + ' '
+
+        allowed_lower, allowed_upper = filter_masks(alphabet, character_filter)
+        contain_lower = contain_upper = None
+
+        if must_contain is not None:
+            if isinstance(must_contain, str):
+                contain_lower, contain_upper = filter_masks(alphabet, must_contain)
+            else:
+                contain_lower = contain_upper = character_mask(alphabet, self.groups[self.current_group])
 
-    sentences = sentences[sentences['text'].str.contains(f'^[{character_filter}]+$')]
+        rows = self.sentence_index.mask_rows(allowed_lower, allowed_upper, contain_lower, contain_upper)
+        profile_rows(len(rows))
 
-    if must_contain is not None:
-        if isinstance(must_contain, str):
-            sentences = sentences[sentences['text'].str.contains(f'[{character_filter}]')]
+        if max_length < 1000:
+            rows = intersect_rows(rows, self.sentence_index.length_rows(0, max_length))
+
+        if weak:
+            # sampled from the weakest sentences
+            rows = self.weak_rows(self.sentence_df, rows)[:count * 10]
+
+        text = '\n'.join(self.sentence_df['text'][self.sample_sentences(rows, count)])
+
+        if append:
+            self.current_lesson['text'] += '\n' + text
         else:
-            sentences = sentences[sentences['text'].str.contains(f"[{groups[current_group]}{groups[current_group].replace('ß', 'ẞ').upper()}]")]
+            self.current_lesson['text'] = text
 
-    text = '\n'.join(random.sample(list(sentences['text']), count))
+    def sentence_state(self):
+        return hashlib.sha1(np.flatnonzero(self.used_sentences).tobytes()).hexdigest()
 
-    if append:
-        current_lesson['text'] += '\n' + text
-    else:
-        current_lesson['text'] = text
+    def sample_sentences(self, rows, count):
+        if self.lesson_sentence_state is None:
+            self.lesson_sentence_state = self.sentence_state()
 
-def copy_lesson():
-    global existing_lessons, current_lesson_index, current_lesson
-    existing_lesson = existing_lessons[current_lesson_index]
-    current_lesson['newCharacters'] = existing_lesson['newCharacters']
+        used = self.used_sentences[rows]
+        unused_rows = rows[~used]
+
+        if len(unused_rows) >= count:
+            sample = self.random.choice(unused_rows, count, replace=False)
+        else:
+            # not enough unused sentences: sentences of previous lessons are repeated, if there are too few at all, fewer are used
+            used_rows = rows[used]
+            sample = self.random.permutation(np.concatenate([unused_rows, self.random.choice(used_rows, min(count - len(unused_rows), len(used_rows)), replace=False)]))
+
+            if len(sample) < count:
+                print(f"warning: only {len(sample)} of {count} sentences available for lesson {self.current_lesson_index + 1}: {self.current_lesson.get('title', '')}", file=sys.stderr)
+
+        self.used_sentences[sample] = True
+        self.lesson_sentences.append(sample)
+
+        return sample
+
+    def copy_lesson(self):
+        existing_lesson = self.existing_lessons[self.current_lesson_index]
+        self.current_lesson['newCharacters'] = existing_lesson['newCharacters']
+
+    # let's make some lessons
+
+    def build(self):
+        # 0,  'Zeigefinger: e und n', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, new_group=True)
+        # 1,  'Mittelfinger: a und r', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, new_group=True)
+        # 2,  'kleine Finger: u und d', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, new_group=True)
+        # 3,  'Ringfinger: i und t', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, new_group=True)
+        # 4,  'Grundstellung uiae nrtd', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, callback = lambda: self.translate_title(4))
+        # 5,  'Sicherheitstest Grundstellung', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson)
+        # 6,  'Silben aus zwei Buchstaben', # bigram
+        self.lesson_wrapper(self.bigram_lesson)
+        # 7,  'Silben aus drei Buchstaben', # three letter words
+        self.lesson_wrapper(self.word_lesson, 12, 15, min_letter_count=3, max_letter_count=3, filter_uppercase_words=True, lower=True)
+        # 8,  'Wir sichern die Grundstellung', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson)
+        # 9,  'Ein kleines Gedicht', # errr - just words
+        self.lesson_wrapper(self.word_lesson, 1, 10, filter_uppercase_words=True, lower=True, title='Sicherheitstest der Grundstellung')
+        # 10, 'Die Mittelfinger: l und g', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, new_group=True)
+        # 11, 'Wir üben: l und g', # 3, 4 and 5 letter words
+        self.lesson_wrapper(self.multi_word_lesson, [6, 2, 4, 3], [8, 3, 7, 3], min_letter_count=[3, 3, 4, 5], max_letter_count=[3, 3, 4, 5], filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 12, 'Sicherheitstest für l und g ', # letter translate + words
+        self.lesson_wrapper(self.multi_word_lesson, [2, 2, 2], [4, 4, 10], min_letter_count=[3, 4, 5], max_letter_count=[3, 4, 6], filter_uppercase_words=True, lower=True, current_group_only=True, limit_translated_lines=9, append=True)
+        # 13, 'Die Zeigefinger: c und h', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 4, 6, min_letter_count=4, max_letter_count=4, filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=10, append=True)
+        # 14, 'Wir üben: c und h ', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 1, 19, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True)
+        # 15, 'Sicherheitstest für c und h ', # words
+        self.lesson_wrapper(self.word_lesson, 1, 20, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 16, 'Mehr Zeigefinger: o und s', # letter translate + words
+        self.lesson_wrapper(self.multi_word_lesson, [4, 4, 4], [5, 3, 7], min_letter_count=[4, 3, 4], max_letter_count=[4, 3, 7], filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=12, append=True)
+        # 17, 'Wir üben: o und s', # repeating words
+        self.lesson_wrapper(self.word_lesson, 3, 22, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 18, 'Sicherheitstest für o und s', # words
+        self.lesson_wrapper(self.word_lesson, 1, 19, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 19, 'Wichtige Konsonanten: w und k', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson, new_group=True, callback=lambda: self.replace_title('Konsonanten', 'Buchstaben'))
+        # 20, 'Wir üben: w und k', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 2, 16, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True)
+        # 21, 'Sicherheitstest für w und k', # words
+        self.lesson_wrapper(self.word_lesson, 1, 25, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 22, 'Neue Buchstaben: p und m', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 2, 16, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True, new_group=True, limit_translated_lines=12, append=True)
+        # 23, 'Wir üben: p und m', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 2, 26, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 24, 'Sicherheitstest für p und m', # words
+        self.lesson_wrapper(self.word_lesson, 1, 33, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 25, 'Neue Buchstaben: z und b', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 3, 24, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True, new_group=True, limit_translated_lines=11, append=True)
+        # 26, 'Wir üben: z und b', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 3, 34, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 27, 'Sicherheitstest für z und b', # words
+        self.lesson_wrapper(self.word_lesson, 1, 36, filter_uppercase_words=True, lower=True, current_group_only=True)
+        # 28, 'Wir wiederholen viele Wörter', # words
+        self.lesson_wrapper(self.word_lesson, 1, 45, filter_uppercase_words=True, lower=True)
+        # 29, 'Wir wiederholen alle Buchstaben', # letter translate
+        self.lesson_wrapper(self.letter_translate_lesson)
+        # 30, 'Neues Satzzeichen: , das Komma', # letter translate + words with comma and getting longer
+        self.lesson_wrapper(self.multi_word_lesson, [4, 1], [7, 12], min_letter_count=[2, 0], max_letter_count=[4, 100], filter_uppercase_words=True, lower=True, random_post_insert=",", random_post_insert_probability=1, new_group=True, limit_translated_lines=3, append=True)
+        # 31, 'Wir üben das Komma', # words with comma
+        self.lesson_wrapper(self.word_lesson, 1, 41, filter_uppercase_words=True, lower=True, random_post_insert=",", random_post_insert_probability=1, skip_words=100)
+        # 32, 'Neues Satzzeichen: . der Punkt', # letter translate + words with period and getting longer
+        self.lesson_wrapper(self.multi_word_lesson, [4, 1], [7, 4], min_letter_count=[2, 0], max_letter_count=[4, 100], filter_uppercase_words=True, lower=True, random_post_insert=".", random_post_insert_probability=1, new_group=True, limit_translated_lines=3, append=True, skip_words=200)
+        # 33, 'Wir üben den Punkt', # words with period
+        self.lesson_wrapper(self.word_lesson, 1, 24, filter_uppercase_words=True, lower=True, random_post_insert=".", random_post_insert_probability=1, skip_words=300)
+        # 34, 'Sicherheitstest', # words with comma or period
+        self.lesson_wrapper(self.word_lesson, 1, 32, filter_uppercase_words=True, lower=True, random_post_insert_probability=1, skip_words=400)
+        # 35, 'Wir wiederholen', # letter translate + words with comma or period (less frequent)
+        self.lesson_wrapper(self.word_lesson, 1, 71, filter_uppercase_words=True, lower=True, random_post_insert_probability=0.1, limit_translated_lines=4, append=True)
+        # 36, 'Linker Umschalter', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 4, 14, filter_uppercase_words=True, start_letters=self.letters_for_hand('r'), lesson_characters=self.letters_for_hand('r'), limit_translated_lines=13, append=True)
+        # 37, 'Wir üben rechts GROẞ und klein im Wechsel', # words
+        self.lesson_wrapper(self.word_lesson, 1, 34, filter_uppercase_words=True, start_letters=self.letters_for_hand('r') + ''.join(self.group_characters[self.current_group]), skip_words=500)
+        # 38, 'Kurze Trainingssätze', # sentences
+        self.lesson_wrapper(self.sentence_lesson, 47, max_length=40, character_filter=self.letters_for_hand('r') + ' ' + ''.join(self.group_characters[self.current_group]))
+        # 39, 'Rechter Umschalter', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 4, 14, filter_uppercase_words=True, start_letters=self.letters_for_hand('l'), lesson_characters=self.letters_for_hand('l'), limit_translated_lines=13, append=True)
+        # 40, 'Wir üben links GROẞ und klein im Wechsel', # words
+        self.lesson_wrapper(self.word_lesson, 1, 34, filter_uppercase_words=True, start_letters=self.letters_for_hand('l') + ''.join(self.group_characters[self.current_group]), skip_words=600)
+        # 41, 'Kurze Trainingssätze', # setences
+        self.lesson_wrapper(self.sentence_lesson, 47, max_length=40, must_contain=self.letters_for_hand('l'))
+        self.uppercase_learned = True
+        # 42, 'Unser Sicherheitstest', # words + sentences
+        self.lesson_wrapper(self.word_lesson, 1, 16, start_letters=self.letters_for_hand('r') + self.letters_for_hand('l'), callback=lambda: self.sentence_lesson(20, max_length=60, append=True))
+        # 43, 'Neue Buchstaben: v und f', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 3, 11, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True, new_group=True, limit_translated_lines=9, append=True)
+        # 44, 'Wir üben v und f', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 1, 23, filter_uppercase_words=True, current_group_only=True, start_letters=True, random_post_insert_probability=0.2)
+        # 45, 'Sicherheitstest für v und f', # words with comma or period
+        self.lesson_wrapper(self.word_lesson, 1, 8, start_letters=True, random_post_insert_probability=1, callback=lambda: self.sentence_lesson(21, max_length=60, must_contain=True, append=True))
+        # 46, 'Die Umlaute: ä und ö ', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 1, 19, filter_uppercase_words=True, current_group_only=True, new_group=True, limit_translated_lines=8, append=True, callback=lambda: self.replace_title('Umlaute', 'Buchstaben'))
+        # 47, 'Wir üben ä und ö', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 1, 18, filter_uppercase_words=True, current_group_only=True, random_post_insert_probability=1, callback=lambda: self.sentence_lesson(16, max_length=60, must_contain=True, append=True))
+        # 48, 'Sicherheitstest für ä und ö', # words with comma or period
+        self.lesson_wrapper(self.sentence_lesson, 21, max_length=60, must_contain=True)
+        # 49, 'Neue Buchstaben: ü und j', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 3, 7, filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=7, append=True)
+        # 50, 'Wir üben ü und j', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 1, 18, filter_uppercase_words=True, current_group_only=True)
+        # 51, 'Sicherheitstest für ü und j', # words with comma or period
+        self.lesson_wrapper(self.sentence_lesson, 30, max_length=60, must_contain=True)
+        # 52, 'Wir wiederholen', # letter translate + words?!
+        self.lesson_wrapper(self.word_lesson, 1, 1, min_letter_count=4, max_letter_count=4, filter_uppercase_words=True, lower=True, limit_translated_lines=2, append=True, callback=lambda:self.word_lesson(1, 1, min_letter_count=4, max_letter_count=4, start_letters=self.groups[5][1].upper(), filter_uppercase_words=True, append=True))
+        # 53, 'Neue Buchstaben: y und ß', # letter translate + words
+        self.lesson_wrapper(self.word_lesson, 3, 10, filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=9, append=True)
+        # 54, 'Wir üben y und ß', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 1, 15, filter_uppercase_words=True, current_group_only=True, random_post_insert_probability=1)
+        # 55, 'Sicherheitstest für y und ß', # words with comma or period
+        self.lesson_wrapper(self.sentence_lesson, 30, max_length=60, must_contain=True)
+        # 57, 'Neue Buchstaben: x und q', # letter translate + words
+        self.current_lesson_index += 1
+        self.lesson_wrapper(self.word_lesson, 3, 14, filter_uppercase_words=True, current_group_only=True, new_group=True, limit_translated_lines=7, append=True)
+        # 58, 'Wir üben x und q', # repeating words starting with letters
+        self.lesson_wrapper(self.word_lesson, 1, 14, filter_uppercase_words=True, current_group_only=True, random_post_insert_probability=0.2, callback=lambda: self.sentence_lesson(6, max_length=40, must_contain=True, append=True))
+        # 59, 'Sicherheitstest für x und q', # words with comma or period
+        self.lesson_wrapper(self.sentence_lesson, 27, max_length=60, must_contain=True)
+        # 56, 'Rechtschreibklippen und häufige Rechtschreibfehler', # copy?
+        self.current_lesson_index = 55
+        self.lesson_wrapper(self.copy_lesson)
+        self.current_lesson_index = 59
+        # 60, 'English test—1000 frequently used words', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 61, 'Deutsche Wörter – 1000 häufigst benutzte Wörter', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 62, 'Die Ziffern', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 63, 'Die Sonderzeichen', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 64, 'Wir üben ein paar Sonderzeichen', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 65, 'Typografie und neue Zeichen', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 66, 'Abkürzungen', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 67, 'Glückwunsch', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 68, 'Testtext „Esperanto“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 69, 'Testtext „Der kleine Prinz“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 70, 'Testtext „Sprichwörter“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 71, 'Testtext „Yoga“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 72, 'Testtext „Psyche“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 73, 'Testtext „Linux und Freie Software“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 74, 'Testtext „Alkohol“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 75, 'Testtext „Säuren“', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 76, 'Shell-Einleitung', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 77, 'Shell-Übung', # copy
+        self.lesson_wrapper(self.copy_lesson)
+        # 78, 'Shell Test', # copy
+        self.lesson_wrapper(self.copy_lesson)
+
+        return self.lessons
+
+    def layout_characters(self):
+        characters = ''.join(self.groups)
+        return characters + characters.replace('ß', '').upper()
+
+    def build_drill(self, weak_characters):
+        # all groups are learned, the lessons prefer the characters with the highest error rates
+        self.current_group = len(self.groups) - 1
+        self.uppercase_learned = True
+
+        for title, lesson_generator, args, kwargs in [
+            ('Bigramme', self.bigram_lesson, (), {}),
+            ('Wörter', self.word_lesson, (3, 30), {'random_post_insert_probability': 0.1}),
+            ('Sätze', self.sentence_lesson, (30,), {'max_length': 60}),
+        ]:
+            self.current_lesson = {'title': f'Training {weak_characters}: {title}', 'newCharacters': weak_characters}
+            if not self.lessons:
+                # the drill is a course of its own, so its first lesson introduces all learned characters
+                self.current_lesson['newCharacters'] = self.layout_characters()
+            lesson_generator(*args, weak=True, **kwargs)
+            self.finish_lesson()
+
+        return self.lessons
 
 ## main code
 
-# data preparation
-
-existing_lessons = read_lessons(neo_course_filename)
-
-groups = keys.split(' ')
-
-group_characters = [set(x) for x in itertools.accumulate(groups)]
-
-translation_table = {ord(neo_key): key for neo_key, key in zip(neo_keys, keys)} | {ord(neo_key.upper()): key.upper() for neo_key, key in zip(neo_keys, keys) if neo_key not in ',.ß' and key not in ',.ß'}
-hand_table = {key: hand for key, hand in zip(keys, hands)}
-
-word_lists = [f'corpus/{name}/{name}-words.txt' for name in corpus]
-sentence_lists = [f'corpus/{name}/{name}-sentences.txt' for name in corpus]
-
-word_df = load_and_prepare_word_list(word_lists, group_characters, True, 10)
-sentence_df = load_and_prepare_word_list(sentence_lists, group_characters)
-bigrams_df = prepare_ngram_list(sentence_df, group_characters)
-
-# let's make some lessons
-
-lessons = []
-current_lesson_index = -1
-current_group = -1
-current_lesson = {}
-uppercase_learned = False
-
-# 0,  'Zeigefinger: e und n', # letter translate
-lesson_wrapper(letter_translate_lesson, new_group=True)
-# 1,  'Mittelfinger: a und r', # letter translate
-lesson_wrapper(letter_translate_lesson, new_group=True)
-# 2,  'kleine Finger: u und d', # letter translate
-lesson_wrapper(letter_translate_lesson, new_group=True)
-# 3,  'Ringfinger: i und t', # letter translate
-lesson_wrapper(letter_translate_lesson, new_group=True)
-# 4,  'Grundstellung uiae nrtd', # letter translate
-lesson_wrapper(letter_translate_lesson, callback = lambda: translate_title(4))
-# 5,  'Sicherheitstest Grundstellung', # letter translate
-lesson_wrapper(letter_translate_lesson)
-# 6,  'Silben aus zwei Buchstaben', # bigram
-lesson_wrapper(bigram_lesson)
-# 7,  'Silben aus drei Buchstaben', # three letter words
-lesson_wrapper(word_lesson, 12, 15, min_letter_count=3, max_letter_count=3, filter_uppercase_words=True, lower=True)
-# 8,  'Wir sichern die Grundstellung', # letter translate
-lesson_wrapper(letter_translate_lesson)
-# 9,  'Ein kleines Gedicht', # errr - just words
-lesson_wrapper(word_lesson, 1, 10, filter_uppercase_words=True, lower=True, title='Sicherheitstest der Grundstellung')
-# 10, 'Die Mittelfinger: l und g', # letter translate
-lesson_wrapper(letter_translate_lesson, new_group=True)
-# 11, 'Wir üben: l und g', # 3, 4 and 5 letter words
-lesson_wrapper(multi_word_lesson, [6, 2, 4, 3], [8, 3, 7, 3], min_letter_count=[3, 3, 4, 5], max_letter_count=[3, 3, 4, 5], filter_uppercase_words=True, lower=True, current_group_only=True)
-# 12, 'Sicherheitstest für l und g ', # letter translate + words
-lesson_wrapper(multi_word_lesson, [2, 2, 2], [4, 4, 10], min_letter_count=[3, 4, 5], max_letter_count=[3, 4, 6], filter_uppercase_words=True, lower=True, current_group_only=True, limit_translated_lines=9, append=True)
-# 13, 'Die Zeigefinger: c und h', # letter translate + words
-lesson_wrapper(word_lesson, 4, 6, min_letter_count=4, max_letter_count=4, filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=10, append=True)
-# 14, 'Wir üben: c und h ', # repeating words starting with letters
-lesson_wrapper(word_lesson, 1, 19, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True)
-# 15, 'Sicherheitstest für c und h ', # words
-lesson_wrapper(word_lesson, 1, 20, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 16, 'Mehr Zeigefinger: o und s', # letter translate + words
-lesson_wrapper(multi_word_lesson, [4, 4, 4], [5, 3, 7], min_letter_count=[4, 3, 4], max_letter_count=[4, 3, 7], filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=12, append=True)
-# 17, 'Wir üben: o und s', # repeating words
-lesson_wrapper(word_lesson, 3, 22, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 18, 'Sicherheitstest für o und s', # words
-lesson_wrapper(word_lesson, 1, 19, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 19, 'Wichtige Konsonanten: w und k', # letter translate
-lesson_wrapper(letter_translate_lesson, new_group=True, callback=lambda: replace_title('Konsonanten', 'Buchstaben'))
-# 20, 'Wir üben: w und k', # repeating words starting with letters
-lesson_wrapper(word_lesson, 2, 16, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True)
-# 21, 'Sicherheitstest für w und k', # words
-lesson_wrapper(word_lesson, 1, 25, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 22, 'Neue Buchstaben: p und m', # letter translate + words
-lesson_wrapper(word_lesson, 2, 16, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True, new_group=True, limit_translated_lines=12, append=True)
-# 23, 'Wir üben: p und m', # repeating words starting with letters
-lesson_wrapper(word_lesson, 2, 26, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 24, 'Sicherheitstest für p und m', # words
-lesson_wrapper(word_lesson, 1, 33, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 25, 'Neue Buchstaben: z und b', # letter translate + words
-lesson_wrapper(word_lesson, 3, 24, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True, new_group=True, limit_translated_lines=11, append=True)
-# 26, 'Wir üben: z und b', # repeating words starting with letters
-lesson_wrapper(word_lesson, 3, 34, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 27, 'Sicherheitstest für z und b', # words
-lesson_wrapper(word_lesson, 1, 36, filter_uppercase_words=True, lower=True, current_group_only=True)
-# 28, 'Wir wiederholen viele Wörter', # words
-lesson_wrapper(word_lesson, 1, 45, filter_uppercase_words=True, lower=True)
-# 29, 'Wir wiederholen alle Buchstaben', # letter translate
-lesson_wrapper(letter_translate_lesson)
-# 30, 'Neues Satzzeichen: , das Komma', # letter translate + words with comma and getting longer
-lesson_wrapper(multi_word_lesson, [4, 1], [7, 12], min_letter_count=[2, 0], max_letter_count=[4, 100], filter_uppercase_words=True, lower=True, random_post_insert=",", random_post_insert_probability=1, new_group=True, limit_translated_lines=3, append=True)
-# 31, 'Wir üben das Komma', # words with comma
-lesson_wrapper(word_lesson, 1, 41, filter_uppercase_words=True, lower=True, random_post_insert=",", random_post_insert_probability=1, skip_words=100)
-# 32, 'Neues Satzzeichen: . der Punkt', # letter translate + words with period and getting longer
-lesson_wrapper(multi_word_lesson, [4, 1], [7, 4], min_letter_count=[2, 0], max_letter_count=[4, 100], filter_uppercase_words=True, lower=True, random_post_insert=".", random_post_insert_probability=1, new_group=True, limit_translated_lines=3, append=True, skip_words=200)
-# 33, 'Wir üben den Punkt', # words with period
-lesson_wrapper(word_lesson, 1, 24, filter_uppercase_words=True, lower=True, random_post_insert=".", random_post_insert_probability=1, skip_words=300)
-# 34, 'Sicherheitstest', # words with comma or period
-lesson_wrapper(word_lesson, 1, 32, filter_uppercase_words=True, lower=True, random_post_insert_probability=1, skip_words=400)
-# 35, 'Wir wiederholen', # letter translate + words with comma or period (less frequent)
-lesson_wrapper(word_lesson, 1, 71, filter_uppercase_words=True, lower=True, random_post_insert_probability=0.1, limit_translated_lines=4, append=True)
-# 36, 'Linker Umschalter', # letter translate + words
-lesson_wrapper(word_lesson, 4, 14, filter_uppercase_words=True, start_letters=letters_for_hand('r'), lesson_characters=letters_for_hand('r'), limit_translated_lines=13, append=True)
-# 37, 'Wir üben rechts GROẞ und klein im Wechsel', # words
-lesson_wrapper(word_lesson, 1, 34, filter_uppercase_words=True, start_letters=letters_for_hand('r') + ''.join(group_characters[current_group]), skip_words=500)
-# 38, 'Kurze Trainingssätze', # sentences
-lesson_wrapper(sentence_lesson, 47, max_length=40, character_filter=letters_for_hand('r') + ' ' + ''.join(group_characters[current_group]))
-# 39, 'Rechter Umschalter', # letter translate + words
-lesson_wrapper(word_lesson, 4, 14, filter_uppercase_words=True, start_letters=letters_for_hand('l'), lesson_characters=letters_for_hand('l'), limit_translated_lines=13, append=True)
-# 40, 'Wir üben links GROẞ und klein im Wechsel', # words
-lesson_wrapper(word_lesson, 1, 34, filter_uppercase_words=True, start_letters=letters_for_hand('l') + ''.join(group_characters[current_group]), skip_words=600)
-# 41, 'Kurze Trainingssätze', # setences
-lesson_wrapper(sentence_lesson, 47, max_length=40, must_contain=letters_for_hand('l'))
-uppercase_learned = True
-# 42, 'Unser Sicherheitstest', # words + sentences
-lesson_wrapper(word_lesson, 1, 16, start_letters=letters_for_hand('r') + letters_for_hand('l'), callback=lambda: sentence_lesson(20, max_length=60, append=True))
-# 43, 'Neue Buchstaben: v und f', # letter translate + words
-lesson_wrapper(word_lesson, 3, 11, filter_uppercase_words=True, lower=True, current_group_only=True, start_letters=True, new_group=True, limit_translated_lines=9, append=True)
-# 44, 'Wir üben v und f', # repeating words starting with letters
-lesson_wrapper(word_lesson, 1, 23, filter_uppercase_words=True, current_group_only=True, start_letters=True, random_post_insert_probability=0.2)
-# 45, 'Sicherheitstest für v und f', # words with comma or period
-lesson_wrapper(word_lesson, 1, 8, start_letters=True, random_post_insert_probability=1, callback=lambda: sentence_lesson(21, max_length=60, must_contain=True, append=True))
-# 46, 'Die Umlaute: ä und ö ', # letter translate + words
-lesson_wrapper(word_lesson, 1, 19, filter_uppercase_words=True, current_group_only=True, new_group=True, limit_translated_lines=8, append=True, callback=lambda: replace_title('Umlaute', 'Buchstaben'))
-# 47, 'Wir üben ä und ö', # repeating words starting with letters
-lesson_wrapper(word_lesson, 1, 18, filter_uppercase_words=True, current_group_only=True, random_post_insert_probability=1, callback=lambda: sentence_lesson(16, max_length=60, must_contain=True, append=True))
-# 48, 'Sicherheitstest für ä und ö', # words with comma or period
-lesson_wrapper(sentence_lesson, 21, max_length=60, must_contain=True)
-# 49, 'Neue Buchstaben: ü und j', # letter translate + words
-lesson_wrapper(word_lesson, 3, 7, filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=7, append=True)
-# 50, 'Wir üben ü und j', # repeating words starting with letters
-lesson_wrapper(word_lesson, 1, 18, filter_uppercase_words=True, current_group_only=True)
-# 51, 'Sicherheitstest für ü und j', # words with comma or period
-lesson_wrapper(sentence_lesson, 30, max_length=60, must_contain=True)
-# 52, 'Wir wiederholen', # letter translate + words?!
-lesson_wrapper(word_lesson, 1, 1, min_letter_count=4, max_letter_count=4, filter_uppercase_words=True, lower=True, limit_translated_lines=2, append=True, callback=lambda:word_lesson(1, 1, min_letter_count=4, max_letter_count=4, start_letters=groups[5][1].upper(), filter_uppercase_words=True, append=True))
-# 53, 'Neue Buchstaben: y und ß', # letter translate + words
-lesson_wrapper(word_lesson, 3, 10, filter_uppercase_words=True, lower=True, current_group_only=True, new_group=True, limit_translated_lines=9, append=True)
-# 54, 'Wir üben y und ß', # repeating words starting with letters
-lesson_wrapper(word_lesson, 1, 15, filter_uppercase_words=True, current_group_only=True, random_post_insert_probability=1)
-# 55, 'Sicherheitstest für y und ß', # words with comma or period
-lesson_wrapper(sentence_lesson, 30, max_length=60, must_contain=True)
-# 57, 'Neue Buchstaben: x und q', # letter translate + words
-current_lesson_index += 1
-lesson_wrapper(word_lesson, 3, 14, filter_uppercase_words=True, current_group_only=True, new_group=True, limit_translated_lines=7, append=True)
-# 58, 'Wir üben x und q', # repeating words starting with letters
-lesson_wrapper(word_lesson, 1, 14, filter_uppercase_words=True, current_group_only=True, random_post_insert_probability=0.2, callback=lambda: sentence_lesson(6, max_length=40, must_contain=True, append=True))
-# 59, 'Sicherheitstest für x und q', # words with comma or period
-lesson_wrapper(sentence_lesson, 27, max_length=60, must_contain=True)
-# 56, 'Rechtschreibklippen und häufige Rechtschreibfehler', # copy?
-current_lesson_index = 55
-lesson_wrapper(copy_lesson)
-current_lesson_index = 59
-# 60, 'English test—1000 frequently used words', # copy
-lesson_wrapper(copy_lesson)
-# 61, 'Deutsche Wörter – 1000 häufigst benutzte Wörter', # copy
-lesson_wrapper(copy_lesson)
-# 62, 'Die Ziffern', # copy
-lesson_wrapper(copy_lesson)
-# 63, 'Die Sonderzeichen', # copy
-lesson_wrapper(copy_lesson)
-# 64, 'Wir üben ein paar Sonderzeichen', # copy
-lesson_wrapper(copy_lesson)
-# 65, 'Typografie und neue Zeichen', # copy
-lesson_wrapper(copy_lesson)
-# 66, 'Abkürzungen', # copy
-lesson_wrapper(copy_lesson)
-# 67, 'Glückwunsch', # copy
-lesson_wrapper(copy_lesson)
-# 68, 'Testtext „Esperanto“', # copy
-lesson_wrapper(copy_lesson)
-# 69, 'Testtext „Der kleine Prinz“', # copy
-lesson_wrapper(copy_lesson)
-# 70, 'Testtext „Sprichwörter“', # copy
-lesson_wrapper(copy_lesson)
-# 71, 'Testtext „Yoga“', # copy
-lesson_wrapper(copy_lesson)
-# 72, 'Testtext „Psyche“', # copy
-lesson_wrapper(copy_lesson)
-# 73, 'Testtext „Linux und Freie Software“', # copy
-lesson_wrapper(copy_lesson)
-# 74, 'Testtext „Alkohol“', # copy
-lesson_wrapper(copy_lesson)
-# 75, 'Testtext „Säuren“', # copy
-lesson_wrapper(copy_lesson)
-# 76, 'Shell-Einleitung', # copy
-lesson_wrapper(copy_lesson)
-# 77, 'Shell-Übung', # copy
-lesson_wrapper(copy_lesson)
-# 78, 'Shell Test', # copy
-lesson_wrapper(copy_lesson)
-
-write_course(output_filename, course, lessons)
+# validation: every character of a lesson has to be introduced by the newCharacters of this or an earlier lesson.
+# The characters of a course don't fit into the 64 bit masks of the corpus (digits and special characters), so the
+# cumulative masks are kept as the index of the introducing lesson per code point and all characters of all lessons
+# are compared with it at once.
+
+def lesson_violations(lessons, ignored=' \n'):
+    codepoints, lengths = text_codepoints([lesson.get('text') or '' for lesson in lessons])
+    new_codepoints, new_lengths = text_codepoints([lesson.get('newCharacters') or '' for lesson in lessons])
+
+    size = int(max(codepoints.max(initial=0), new_codepoints.max(initial=0), *map(ord, ignored))) + 1
+    introduced = np.full(size, len(lessons), dtype=np.int64)
+    np.minimum.at(introduced, new_codepoints, np.repeat(np.arange(len(lessons)), new_lengths))
+    introduced[[ord(character) for character in ignored]] = 0
+
+    lesson_indices = np.repeat(np.arange(len(lessons)), lengths)
+    invalid = introduced[codepoints] > lesson_indices
+
+    violations = collections.defaultdict(str)
+    for code in np.unique(lesson_indices[invalid] * size + codepoints[invalid]).tolist():
+        violations[code // size] += chr(code % size)
+
+    return dict(violations)
+
+def report_violations(name, lessons):
+    violations = lesson_violations(lessons)
+
+    for index, characters in violations.items():
+        print(f"{name}: lesson {index + 1} '{lessons[index].get('title')}' uses characters that are not introduced yet: {characters}", file=sys.stderr)
+
+    return len(violations)
+
+def generate_course(corpus_data, layout, rebuild=False):
+    filename = lesson_cache_filename(layout['output_filename'])
+    lesson_cache = None if filename is None else LessonCache(filename)
+
+    if rebuild and lesson_cache is not None:
+        lesson_cache.lessons = {}
+
+    # every lesson is written as soon as it is finished
+    with profile_stage(f"course {layout['output_filename']}"):
+        with CourseWriter(layout['output_filename'], dict(layout['course'])) as writer:
+            lessons = CourseBuilder(corpus_data, layout, writer.write_lesson, lesson_cache).build()
+
+        if lesson_cache is not None:
+            lesson_cache.save()
+
+    with profile_stage(f"validate {layout['output_filename']}"):
+        report_violations(layout['output_filename'], lessons)
+
+def generate_drill(corpus_data, layout, errors, typed, weak_character_count=8):
+    # the drill course is written next to the course of the layout
+    filename = f"{os.path.splitext(layout['output_filename'])[0]}.drill.xml"
+
+    with profile_stage(f'drill {filename}'):
+        builder = CourseBuilder(corpus_data, layout)
+        builder.weakness = character_weakness(errors, typed, corpus_data.ngram_dfs[2])
+
+        # only the characters of the layout are practised, errors on digits and special characters can't be
+        candidates = sorted({ord(character) for character in builder.layout_characters()} & set(np.flatnonzero(builder.weakness > 0).tolist()), key=lambda codepoint: (-builder.weakness[codepoint], codepoint))
+        weak_characters = ''.join(map(chr, candidates[:weak_character_count]))
+
+        write_course(filename, dict(layout['course'], title=f"{layout['course']['title']} – Training"), builder.build_drill(weak_characters))
+
+    return filename
+
+# batch mode: several layouts (each a dict with keys and course and optionally corpus, hands, output_filename and seed)
+# are generated with a single load of each corpus, optionally in parallel worker processes or threads
+
+def default_layout():
+    return {'keys': keys, 'hands': hands, 'course': course, 'corpus': corpus, 'output_filename': output_filename, 'seed': seed}
+
+def complete_layout(layout):
+    layout['course'] = {'description': course['description']} | layout['course']
+    layout.setdefault('corpus', corpus)
+    layout.setdefault('hands', hands)
+    layout.setdefault('seed', seed)
+    layout.setdefault('output_filename', f"{output_directory}/{layout['course']['keyboardLayout'].replace('(', '.').replace(')', '')}.xml")
+
+    return layout
+
+def load_layouts(filename):
+    with open(filename, encoding='utf-8') as file:
+        layouts = json.load(file)
+
+    return [complete_layout(layout) for layout in layouts]
+
+batch_corpora = {}
+
+def corpus_key(names):
+    return tuple(name if isinstance(name, str) else tuple(name) for name in names)
+
+def generate_batch_course(layout, rebuild=False):
+    names = corpus_key(layout['corpus'])
+
+    # with the fork start method the corpora loaded by the parent process are shared, otherwise they are loaded (from cache)
+    if names not in batch_corpora:
+        batch_corpora[names] = Corpus(names)
+
+    generate_course(batch_corpora[names], layout, rebuild)
+
+    return layout['output_filename']
+
+def generate_batch_course_in_process(layout, rebuild=False):
+    # the profiling records of a worker process are sent back to the main process
+    if profiler is not None:
+        profiler.records = []
+
+    filename = generate_batch_course(layout, rebuild)
+
+    return filename, profiler.records if profiler is not None else []
+
+def run_batch(layouts, jobs=1, threads=False, rebuild=False):
+    import concurrent.futures
+    import multiprocessing
+
+    for layout in layouts:
+        names = corpus_key(layout['corpus'])
+        if names not in batch_corpora:
+            batch_corpora[names] = Corpus(names)
+
+    if jobs > 1 and len(layouts) > 1:
+        if threads:
+            executor = concurrent.futures.ThreadPoolExecutor(min(jobs, len(layouts)))
+        else:
+            context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+            executor = concurrent.futures.ProcessPoolExecutor(min(jobs, len(layouts)), mp_context=context)
+
+        with executor:
+            if threads:
+                for filename in executor.map(generate_batch_course, layouts, itertools.repeat(rebuild)):
+                    print(f'written {filename}')
+            else:
+                for filename, records in executor.map(generate_batch_course_in_process, layouts, itertools.repeat(rebuild)):
+                    if profiler is not None:
+                        profiler.records.extend(records)
+                    print(f'written {filename}')
+    else:
+        for layout in layouts:
+            print(f'written {generate_batch_course(layout, rebuild)}')
+
+# server mode: the corpora are loaded and indexed once, then lessons and courses are generated on requests to a local
+# HTTP server (POST with a JSON body), for example
+#   curl -H 'Content-Type: application/json' -d '{"layout": "de.bone", "lesson": "word_lesson", "group": 5, "seed": 1, "args": [3, 30]}' localhost:8150/lesson
+#   curl -H 'Content-Type: application/json' -d '{"layout": "de.bone", "rebuild": true}' localhost:8150/course
+# a layout is either the name of a layout the server was started with (its name or the name of its output file without
+# .xml, several courses use the same keyboardLayout) or a layout like in the batch mode with the corpus of one of those,
+# whose course is always written to the requests folder in the output folder
+
+request_output_directory = f'{output_directory}/requests'
+
+server_lessons = ('word_lesson', 'multi_word_lesson', 'bigram_lesson', 'sentence_lesson')
+
+def layout_name(layout):
+    return layout.get('name', os.path.splitext(os.path.basename(layout['output_filename']))[0])
+
+class LessonServer:
+    def __init__(self, layouts):
+        self.layouts = {}
+
+        for layout in layouts:
+            if layout_name(layout) in self.layouts:
+                raise ValueError(f'several layouts are named {layout_name(layout)}, give them a unique name')
+
+            self.layouts[layout_name(layout)] = layout
+
+        self.lock = threading.Lock()
+        self.builders = {}
+        self.course_locks = collections.defaultdict(threading.Lock)
+        self.protected_filenames = {os.path.abspath(neo_course_filename)} | {os.path.abspath(layout['output_filename']) for layout in layouts}
+
+        for layout in layouts:
+            self.corpus(layout)
+
+    def corpus(self, layout):
+        names = corpus_key(layout['corpus'])
+
+        with self.lock:
+            if names not in batch_corpora:
+                batch_corpora[names] = Corpus(names)
+
+            return batch_corpora[names]
+
+    def layout(self, layout):
+        if isinstance(layout, str):
+            if layout not in self.layouts:
+                raise ValueError(f'unknown layout {layout}')
+
+            return self.layouts[layout]
+
+        # the files of a layout from a request are chosen by the server, its course is written to a folder of its own so
+        # it can't replace the Neo course or the course of a layout of the server
+        layout = complete_layout({key: value for key, value in layout.items() if key not in ('layout_filename', 'output_filename')})
+        layout['output_filename'] = os.path.join(request_output_directory, os.path.basename(layout['output_filename']))
+        filename = os.path.abspath(layout['output_filename'])
+
+        if os.path.dirname(filename) != os.path.abspath(request_output_directory) or filename in self.protected_filenames:
+            raise ValueError(f"invalid keyboardLayout {layout['course']['keyboardLayout']}")
+
+        if corpus_key(layout['corpus']) not in batch_corpora:
+            raise ValueError(f"the corpus {layout['corpus']} is not loaded, use the corpus of one of the layouts of the server")
+
+        return layout
+
+    def builder(self, layout, seed=None):
+        # the groups of the corpus rows are assigned once per layout, every request works on a copy with its own state
+        key = json.dumps([layout['keys'], layout['hands'], layout['course']['keyboardLayout'], layout.get('layout_filename'), corpus_key(layout['corpus'])])
+        corpus_data = self.corpus(layout)
+
+        with self.lock:
+            if key not in self.builders:
+                self.builders[key] = CourseBuilder(corpus_data, layout)
+
+            builder = copy.copy(self.builders[key])
+
+        builder.reset(seed)
+
+        return builder
+
+    def lesson(self, request):
+        if request.get('lesson') not in server_lessons:
+            raise ValueError(f"lesson has to be one of {', '.join(server_lessons)}")
+
+        builder = self.builder(self.layout(request['layout']), request.get('seed'))
+
+        # the group is given by its index or its characters, by default all groups are learned
+        group = request.get('group', len(builder.groups) - 1)
+        builder.current_group = builder.groups.index(group) if isinstance(group, str) else group
+        builder.uppercase_learned = request.get('uppercase_learned', False)
+
+        if not 0 <= builder.current_group < len(builder.groups):
+            raise ValueError(f'group {group} out of range')
+
+        getattr(builder, request['lesson'])(*request.get('args', ()), **request.get('kwargs', {}))
+
+        return {'text': builder.current_lesson['text']}
+
+    def course(self, request):
+        layout = self.layout(request['layout'])
+
+        # requests for the same course are generated one after the other, as they share the output and lesson cache files
+        with self.lock:
+            course_lock = self.course_locks[os.path.abspath(layout['output_filename'])]
+
+        with course_lock:
+            os.makedirs(os.path.dirname(layout['output_filename']) or '.', exist_ok=True)
+            generate_course(self.corpus(layout), layout, request.get('rebuild', False))
+
+        return {'output_filename': layout['output_filename']}
+
+    def respond(self, path, content_type, body):
+        handlers = {'/lesson': self.lesson, '/course': self.course}
+
+        try:
+            if path not in handlers:
+                return 404, {'error': f'unknown path {path}, use /lesson or /course'}
+
+            if content_type != 'application/json':
+                # a browser can't send this content type to another origin without asking first, which the server never allows
+                return 415, {'error': 'the request has to be sent with Content-Type: application/json'}
+
+            return 200, handlers[path](json.loads(body or b'{}'))
+        except (ValueError, KeyError, TypeError) as error:
+            return 400, {'error': f'{type(error).__name__}: {error}'}
+        except Exception as error:
+            return 500, {'error': f'{type(error).__name__}: {error}'}
+
+def serve(layouts, port, host='127.0.0.1'):
+    import http.server
+
+    lesson_server = LessonServer(layouts)
+
+    class LessonRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            status, response = lesson_server.respond(self.path, self.headers.get_content_type(), self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            body = json.dumps(response, ensure_ascii=False).encode()
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    with http.server.ThreadingHTTPServer((host, port), LessonRequestHandler) as server:
+        print(f'serving lessons on http://{host}:{server.server_port}')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Modifies the ktouch course "Deutsches Neo 2" to other keyboard layouts.')
+    parser.add_argument('--batch', metavar='FILE', help='JSON file with a list of layouts to generate instead of the layout configured in the script')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes for the batch mode')
+    parser.add_argument('--threads', action='store_true', help='use worker threads instead of processes for the batch mode')
+    parser.add_argument('--seed', type=int, help='seed of the courses (without a seed of their own in the --batch file), the same seed generates the same course')
+    parser.add_argument('--rebuild', action='store_true', help='generate all lessons again instead of reusing unchanged lessons from the cache')
+    parser.add_argument('--profile', action='store_true', help='print the time, peak memory and scanned rows of every stage and lesson')
+    parser.add_argument('--profile-output', metavar='FILE', help='also write the profile as JSON to this file')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='load the corpora once and generate lessons and courses on HTTP requests to this port (the layouts of --batch or the configured one)')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the server of --serve')
+    parser.add_argument('--validate', nargs='*', metavar='FILE', help='check that the lessons of the courses (by default all courses in the output folder except the drills) only use characters introduced so far')
+    parser.add_argument('--drill', metavar='DATABASE', help="write practice lessons for the characters with the most errors in ktouch's profile database (e.g. ~/.local/share/ktouch/profiles.db) to <output_filename>.drill.xml")
+    parser.add_argument('--drill-profile', metavar='NAME', help='only use the statistics of this ktouch profile for --drill')
+    arguments = parser.parse_args()
+
+    if arguments.profile or arguments.profile_output is not None:
+        profiler = Profiler()
+
+    if arguments.seed is not None:
+        seed = arguments.seed
+
+    if arguments.validate is not None:
+        filenames = arguments.validate or sorted(os.path.join(output_directory, filename) for filename in os.listdir(output_directory) if filename.endswith('.xml') and not filename.endswith('.drill.xml'))
+        invalid_courses = sum(report_violations(filename, read_lessons(filename)) > 0 for filename in filenames)
+
+        print(f'{len(filenames) - invalid_courses} of {len(filenames)} courses valid')
+
+        if invalid_courses > 0:
+            sys.exit(1)
+    elif arguments.serve is not None:
+        serve(load_layouts(arguments.batch) if arguments.batch is not None else [default_layout()], arguments.serve, arguments.host)
+    elif arguments.drill is not None:
+        errors, typed = read_error_statistics(arguments.drill, arguments.drill_profile)
+
+        for layout in load_layouts(arguments.batch) if arguments.batch is not None else [default_layout()]:
+            names = corpus_key(layout['corpus'])
+            if names not in batch_corpora:
+                batch_corpora[names] = Corpus(names)
+
+            print(f'written {generate_drill(batch_corpora[names], layout, errors, typed)}')
+    elif arguments.batch is None:
+        generate_course(Corpus(corpus), default_layout(), arguments.rebuild)
+    else:
+        run_batch(load_layouts(arguments.batch), arguments.jobs, arguments.threads, arguments.rebuild)
+
+    if profiler is not None:
+        profiler.report()
+
+        if arguments.profile_output is not None:
+            profiler.write(arguments.profile_output)